@@ -0,0 +1,101 @@
+"""Benchmark deduplicate() against the old all-pairs SequenceMatcher version.
+
+    python bench/bench_dedup.py [--sizes 100,1000,10000] [--legacy-max 2000]
+
+Headlines are synthetic: random vocabulary titles plus near-duplicate
+rewrites of them (source suffixes, prefixes, a swapped word), which is what
+collapsing the same story from several feeds looks like.
+"""
+import argparse, os, random, sys, time
+from difflib import SequenceMatcher
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from brief_bot import deduplicate  # noqa: E402
+
+
+def legacy_deduplicate(articles, threshold=0.82):
+    seen_titles = []
+    unique = []
+    for item in articles:
+        title = item.get("title", "")
+        is_dupe = any(
+            SequenceMatcher(None, title.lower(), seen.lower()).ratio() > threshold
+            for seen in seen_titles
+        )
+        if not is_dupe:
+            seen_titles.append(title)
+            unique.append(item)
+    return unique
+
+
+# A real news vocabulary is large; a tiny one makes every title look alike
+# and overstates both implementations' work.
+_vocab_rng = random.Random(1)
+WORDS = (
+    "fed rates inflation ukraine russia china taiwan oil opec gaza israel iran nvidia "
+    "apple tesla bitcoin ether earnings jobs report strike drone missile election "
+    "tariff trade talks ceasefire sanctions bank crisis bond yields rally selloff "
+    "ai model launch startup funding chip export ban summit protest court ruling"
+).split() + [
+    "".join(_vocab_rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(_vocab_rng.randint(3, 9)))
+    for _ in range(3000)
+]
+SUFFIXES = [" - Reuters", " | BBC", " - Bloomberg", " (AP)", ""]
+PREFIXES = ["BREAKING: ", "JUST IN: ", "", ""]
+
+
+def make_headlines(n, dup_rate=0.3, seed=7):
+    rng = random.Random(seed)
+    base = []
+    out = []
+    for _ in range(n):
+        if base and rng.random() < dup_rate:
+            words = rng.choice(base).split()
+            if len(words) > 4 and rng.random() < 0.5:
+                words[rng.randrange(len(words))] = rng.choice(WORDS)
+            title = rng.choice(PREFIXES) + " ".join(words) + rng.choice(SUFFIXES)
+        else:
+            title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(7, 13))).capitalize()
+            base.append(title)
+        out.append({"title": title, "link": "https://example.com/" + str(len(out))})
+    return out
+
+
+def timed(fn, items):
+    t0 = time.perf_counter()
+    kept = fn(items)
+    return time.perf_counter() - t0, kept
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,1000,10000")
+    ap.add_argument("--legacy-max", type=int, default=2000,
+                    help="above this many headlines the quadratic version is extrapolated, not run")
+    args = ap.parse_args()
+
+    print("{:>7}  {:>11}  {:>10}  {:>8}  {:>7}  {:>7}".format(
+        "n", "legacy s", "lsh s", "speedup", "kept", "agree"))
+    last = None   # (n, seconds) of the largest legacy run, for extrapolation
+    for n in [int(x) for x in args.sizes.split(",")]:
+        items = make_headlines(n)
+        t_new, kept_new = timed(deduplicate, items)
+        if n <= args.legacy_max or last is None:
+            t_old, kept_old = timed(legacy_deduplicate, items)
+            last = (n, t_old)
+            old_links = {i["link"] for i in kept_old}
+            new_links = {i["link"] for i in kept_new}
+            agree = "{:.1%}".format(1 - len(old_links ^ new_links) / max(1, len(old_links | new_links)))
+            legacy = "{:.3f}".format(t_old)
+        else:
+            # all-pairs work grows with n^2
+            t_old = last[1] * (n / last[0]) ** 2
+            legacy, agree = "~{:.0f}".format(t_old), "-"
+        print("{:>7}  {:>11}  {:>10.3f}  {:>7.0f}x  {:>7}  {:>7}".format(
+            n, legacy, t_new, t_old / t_new, len(kept_new), agree))
+
+
+if __name__ == "__main__":
+    main()
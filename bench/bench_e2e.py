@@ -0,0 +1,292 @@
+"""End-to-end benchmark of brief_bot.py against local stand-ins, fully offline.
+
+    python bench/bench_e2e.py [--users 20] [--repeat 3] [--out report.json] [--compare base.json]
+
+The bot runs unmodified as a subprocess, pointed at the servers in fakes.py
+through its env overrides (TELEGRAM_API_URL, GROQ_BASE_URL, FEEDS_CONFIG,
+HYPERLIQUID_*_URL, FEAR_GREED_URL, FINNHUB_URL) and at bench/stubs/yfinance.py
+through PYTHONPATH. Commands are injected through the fake getUpdates.
+
+Measured:
+  startup      spawn to the first getUpdates poll
+  single       /all latency from a lone user, `--repeat` times: time from the
+               bot receiving the command to its first and last message
+  concurrent   `--users` chats sending /all at once: per-chat latency
+               percentiles, wall time and briefs per second
+  process      peak RSS and CPU time of the bot (RUSAGE_CHILDREN)
+
+A brief counts as done once every stand-in has been quiet for `--quiet`
+seconds. In the default cold mode SNAPSHOT_MAX_AGE=0, so each /all rebuilds
+(concurrent requests still coalesce); --warm serves the background snapshots.
+"""
+import argparse, json, os, resource, shutil, signal, subprocess, sys, tempfile, time
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fakes import Activity, FeedServer, GroqServer, HyperliquidServer, HyperliquidWS, TelegramServer  # noqa: E402
+
+# Same shape as the real lists in brief_bot.py
+SECTIONS = {"osint": 12, "market": 7, "tech": 8, "newsletters": 9}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize_latencies(values):
+    return {"n": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+            "max": max(values) if values else None, "mean": sum(values) / len(values) if values else None}
+
+
+def wait_quiet(activity, quiet, timeout):
+    t0 = time.monotonic()
+    while activity.quiet_for() < quiet:
+        if time.monotonic() - t0 > timeout:
+            raise TimeoutError("bot still busy after %ds" % timeout)
+        time.sleep(0.1)
+
+
+def chat_latency(tg, chat_id):
+    delivered = tg.delivered.get(chat_id)
+    calls = tg.calls.get(chat_id, [])
+    if delivered is None or not calls:
+        return None, None
+    return calls[0][0] - delivered, calls[-1][0] - delivered
+
+
+def write_feeds_config(path, feed_servers):
+    hosts = [s.url for s in feed_servers]
+    config, n = {}, 0
+    for section, count in SECTIONS.items():
+        urls = []
+        for _ in range(count):
+            urls.append(hosts[n % len(hosts)] + "/{}/{}.xml".format(section, n))
+            n += 1
+        config[section] = [["Newsletter %d" % i, u] for i, u in enumerate(urls)] if section == "newsletters" else urls
+    with open(path, "w") as f:
+        json.dump(config, f, indent=1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def start_stand_ins(args):
+    """Start every stand-in; returns them in a SimpleNamespace."""
+    activity = Activity()
+    # Loopback aliases stand in for distinct hosts so per-host limits apply as in production
+    feed_servers = [FeedServer("127.0.0.%d" % (i + 1), items=args.items, item_bytes=args.item_bytes,
+                               latency=args.feed_latency, fail_rate=args.fail_rate, etags=not args.no_etag,
+                               activity=activity)
+                    for i in range(args.hosts)]
+    groq = GroqServer(ttft=args.groq_ttft, chunks=args.groq_chunks, chunk_delay=args.groq_chunk_delay,
+                      activity=activity)
+    tg = TelegramServer(activity=activity)
+    hl = HyperliquidServer()
+    hl_ws = HyperliquidWS(interval=args.liq_interval)
+    return SimpleNamespace(activity=activity, feed_servers=feed_servers, groq=groq, tg=tg, hl=hl, hl_ws=hl_ws)
+
+
+def bot_env(si, workdir, args):
+    """Environment that points the bot at the stand-ins, with state in workdir."""
+    feed_servers, groq, tg, hl, hl_ws = si.feed_servers, si.groq, si.tg, si.hl, si.hl_ws
+    write_feeds_config(os.path.join(workdir, "feeds.json"), feed_servers)
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": tg.url,
+        "GROQ_API_KEY": "bench",
+        "GROQ_BASE_URL": groq.url,
+        "CHANNEL_ID": "-1000",
+        "RSSHUB_URL": feed_servers[0].url,
+        "FEEDS_CONFIG": os.path.join(workdir, "feeds.json"),
+        "FEAR_GREED_URL": feed_servers[0].url + "/fng/",
+        "FINNHUB_URL": feed_servers[0].url,
+        "HYPERLIQUID_API_URL": hl.url + "/info",
+        "HYPERLIQUID_WS_URL": hl_ws.url,
+        "ACLED_EMAIL": "",
+        "ACLED_PASSWORD": "",
+        "BENCH_YF_LATENCY": str(args.yf_latency),
+        "PYTHONPATH": os.path.join(HERE, "stubs") + os.pathsep + env.get("PYTHONPATH", ""),
+        "PYTHONUNBUFFERED": "1",
+    })
+    if not args.warm:
+        env["SNAPSHOT_MAX_AGE"] = "0"
+    for pair in args.env:
+        key, _, value = pair.partition("=")
+        env[key] = value
+    return env
+
+
+def run(args):
+    si = start_stand_ins(args)
+    activity, feed_servers, groq, tg, hl, hl_ws = si.activity, si.feed_servers, si.groq, si.tg, si.hl, si.hl_ws
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    env = bot_env(si, workdir, args)
+
+    report = {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args)}
+    log_path = os.path.join(workdir, "bot.log")
+    with open(log_path, "w") as log_file:
+        t0 = time.monotonic()
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "brief_bot.py")], cwd=workdir, env=env,
+                                stdout=log_file, stderr=subprocess.STDOUT)
+        try:
+            if not tg.first_poll.wait(args.timeout):
+                raise TimeoutError("bot never polled for updates, see " + log_path)
+            report["startup_s"] = time.monotonic() - t0
+            # Let the startup snapshot refreshes and push-account seeding finish
+            wait_quiet(activity, args.quiet, args.timeout)
+
+            firsts, lasts = [], []
+            for i in range(args.repeat):
+                chat_id = 1000 + i
+                tg.inject(chat_id, "/all")
+                wait_quiet(activity, args.quiet, args.timeout)
+                first, last = chat_latency(tg, chat_id)
+                if last is not None:
+                    firsts.append(first)
+                    lasts.append(last)
+            report["single"] = {"first_message_s": summarize_latencies(firsts), "done_s": summarize_latencies(lasts)}
+
+            chats = [2000 + i for i in range(args.users)]
+            for chat_id in chats:
+                tg.inject(chat_id, "/all")
+            wait_quiet(activity, args.quiet, args.timeout)
+            results = [chat_latency(tg, c) for c in chats]
+            done = [r[1] for r in results if r[1] is not None]
+            starts = [tg.delivered[c] for c in chats if c in tg.delivered]
+            ends = [tg.calls[c][-1][0] for c in chats if tg.calls.get(c)]
+            wall = max(ends) - min(starts) if ends and starts else None
+            report["concurrent"] = {
+                "users": args.users,
+                "answered": len(done),
+                "first_message_s": summarize_latencies([r[0] for r in results if r[0] is not None]),
+                "done_s": summarize_latencies(done),
+                "wall_s": wall,
+                "briefs_per_s": len(done) / wall if wall else None,
+            }
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    report["process"] = {"max_rss_mb": usage.ru_maxrss / 1024, "cpu_user_s": usage.ru_utime,
+                         "cpu_sys_s": usage.ru_stime, "cpu_s": usage.ru_utime + usage.ru_stime}
+    report["stand_ins"] = {
+        "feeds": _merge([s.stats for s in feed_servers]),
+        "groq": dict(groq.stats),
+        "telegram": dict(tg.stats),
+        "hyperliquid": dict(hl.stats, **{"ws_" + k: v for k, v in hl_ws.stats.items()}),
+    }
+    if args.keep:
+        report["workdir"] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def _merge(stats):
+    out = {}
+    for s in stats:
+        for k, v in s.items():
+            out[k] = out.get(k, 0) + v
+    return out
+
+
+# (label, path into the report, lower is better)
+HEADLINE = [
+    ("startup s",             ("startup_s",),                        True),
+    ("/all first msg p50 s",  ("single", "first_message_s", "p50"),  True),
+    ("/all done p50 s",       ("single", "done_s", "p50"),           True),
+    ("concurrent done p50 s", ("concurrent", "done_s", "p50"),       True),
+    ("concurrent done p95 s", ("concurrent", "done_s", "p95"),       True),
+    ("briefs/s",              ("concurrent", "briefs_per_s"),        False),
+    ("peak RSS MB",           ("process", "max_rss_mb"),             True),
+    ("CPU s",                 ("process", "cpu_s"),                  True),
+    ("feed requests",         ("stand_ins", "feeds", "requests"),    True),
+    ("groq requests",         ("stand_ins", "groq", "requests"),     True),
+]
+
+
+def _get(report, path):
+    for key in path:
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+
+def print_report(report, base=None):
+    width = max(len(label) for label, _, _ in HEADLINE)
+    head = "{:<{w}}  {:>10}".format("metric", report.get("commit") or "this", w=width)
+    if base:
+        head += "  {:>10}  {:>8}".format(base.get("commit") or "base", "change")
+    print(head)
+    for label, path, lower_better in HEADLINE:
+        value = _get(report, path)
+        line = "{:<{w}}  {:>10}".format(label, "-" if value is None else "{:.3f}".format(value), w=width)
+        if base:
+            old = _get(base, path)
+            line += "  {:>10}".format("-" if old is None else "{:.3f}".format(old))
+            if value is not None and old:
+                change = (value - old) / old * 100
+                better = change < 0 if lower_better else change > 0
+                line += "  {:>+7.1f}%{}".format(change, "" if abs(change) < 5 else (" better" if better else " worse"))
+        print(line)
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--users", type=int, default=20, help="concurrent chats sending /all")
+    ap.add_argument("--repeat", type=int, default=3, help="sequential single-user /all runs")
+    ap.add_argument("--warm", action="store_true", help="serve background snapshots instead of rebuilding")
+    ap.add_argument("--hosts", type=int, default=4, help="distinct feed hosts (127.0.0.x)")
+    ap.add_argument("--items", type=int, default=20, help="items per feed")
+    ap.add_argument("--item-bytes", type=int, default=600, help="description size per item")
+    ap.add_argument("--feed-latency", type=float, default=0.2, help="mean feed response time, s")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="share of feed requests answered 503")
+    ap.add_argument("--no-etag", action="store_true", help="never answer 304")
+    ap.add_argument("--groq-ttft", type=float, default=0.4)
+    ap.add_argument("--groq-chunks", type=int, default=12)
+    ap.add_argument("--groq-chunk-delay", type=float, default=0.08)
+    ap.add_argument("--yf-latency", type=float, default=0.5)
+    ap.add_argument("--liq-interval", type=float, default=1.0, help="seconds between WebSocket trade pushes")
+    ap.add_argument("--quiet", type=float, default=3.0, help="idle seconds that mark a brief as done")
+    ap.add_argument("--timeout", type=float, default=300)
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra env for the bot")
+    ap.add_argument("--keep", action="store_true", help="keep the bot's work dir (log, state, caches)")
+    ap.add_argument("--out", help="write the JSON report here")
+    ap.add_argument("--compare", help="earlier JSON report to compare against")
+    return ap
+
+
+def main():
+    args = build_parser().parse_args()
+
+    report = run(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    base = None
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+    print_report(report, base)
+
+
+if __name__ == "__main__":
+    main()
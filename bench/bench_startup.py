@@ -0,0 +1,105 @@
+"""Cold-start benchmark: how long until the bot answers its first command.
+
+    python bench/bench_startup.py [--runs 5] [--out startup.json] [--compare base.json]
+
+Each run spawns brief_bot.py against the stand-ins from bench_e2e.py with a
+/help already waiting in the fake getUpdates queue, the way a redeploy finds
+its backlog, and records:
+  import_s         `import brief_bot` alone, in a fresh interpreter
+  first_poll_s     spawn to the first getUpdates call
+  first_reply_s    spawn to the bot's reply to that /help
+Medians over the runs are reported; --compare shows the change against an
+earlier report.
+"""
+import argparse, json, os, shutil, signal, statistics, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from bench_e2e import bot_env, build_parser, git_commit, start_stand_ins  # noqa: E402
+
+METRICS = ("import_s", "first_poll_s", "first_reply_s")
+
+
+def time_import(env):
+    # None if the import fails or never returns (a module that starts the bot on import)
+    code = "import time; t = time.perf_counter(); import brief_bot; print(time.perf_counter() - t)"
+    try:
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=20)
+    except subprocess.TimeoutExpired:
+        return None
+    return float(out.stdout.strip().splitlines()[-1]) if out.returncode == 0 else None
+
+
+def one_run(si, env, workdir, chat_id, timeout):
+    tg = si.tg
+    tg.first_poll.clear()
+    tg.inject(chat_id, "/help")
+    t0 = time.monotonic()
+    with open(os.path.join(workdir, "bot.log"), "a") as log_file:
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "brief_bot.py")], cwd=workdir, env=env,
+                                stdout=log_file, stderr=subprocess.STDOUT)
+        try:
+            result = {"first_poll_s": None, "first_reply_s": None}
+            if tg.first_poll.wait(timeout):
+                result["first_poll_s"] = time.monotonic() - t0
+            deadline = time.monotonic() + timeout
+            while not tg.calls.get(chat_id) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            if tg.calls.get(chat_id):
+                result["first_reply_s"] = tg.calls[chat_id][0][0] - t0
+            return result
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--keep", action="store_true", help="keep the bot's work dir")
+    ap.add_argument("--out", help="write the JSON report here")
+    ap.add_argument("--compare", help="earlier JSON report to compare against")
+    args = ap.parse_args()
+
+    si = start_stand_ins(build_parser().parse_args([]))
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = bot_env(si, workdir, build_parser().parse_args(["--warm"]))
+    runs = []
+    # Later runs start from the state and caches the earlier ones left, like a redeploy
+    for i in range(args.runs):
+        run = {"import_s": time_import(env)}
+        run.update(one_run(si, env, workdir, 500 + i, args.timeout))
+        runs.append(run)
+    report = {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": runs}
+    for key in METRICS:
+        values = [r[key] for r in runs if r[key] is not None]
+        report[key] = statistics.median(values) if values else None
+    if args.keep:
+        report["workdir"] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    base = None
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+    for key in METRICS:
+        value = report[key]
+        line = "{:<14} {:>8}".format(key, "-" if value is None else "{:.3f}".format(value))
+        if base and base.get(key) and value is not None:
+            line += "  {:>8.3f}  {:+.1f}%".format(base[key], (value - base[key]) / base[key] * 100)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+"""Local stand-ins for the services brief_bot.py talks to, for offline benchmarks.
+
+    FeedServer         RSS / Atom / RDF feeds (any path), plus the Fear & Greed
+                       and Finnhub calendar endpoints
+    GroqServer         OpenAI-compatible chat completions, streaming or not
+    TelegramServer     Bot API: getUpdates long polling, sendMessage, editMessageText
+    HyperliquidServer  POST /info recentTrades
+    HyperliquidWS      trades WebSocket (a minimal RFC 6455 server)
+
+Every server runs on daemon threads in this process and counts what it served
+in `stats`; a shared Activity clock is bumped on every request so the harness can tell
+when the bot has gone quiet.
+"""
+import base64, hashlib, json, random, socket, struct, sys, threading, time, zlib
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+WORDS = (
+    "fed rates inflation ukraine russia china taiwan oil opec gaza israel iran nvidia "
+    "apple tesla bitcoin ether earnings jobs report strike drone missile election "
+    "tariff trade talks ceasefire sanctions bank crisis bond yields rally selloff "
+    "ai model launch startup funding chip export ban summit protest court ruling "
+    "market stocks europe asia budget deal vote army navy border port grain gas "
+    "power grid outage merger lawsuit probe regulator data center cloud robot"
+).split()
+
+
+class Activity:
+    """Shared last-activity clock for all stand-ins."""
+
+    def __init__(self):
+        self.stamp = time.monotonic()
+
+    def touch(self):
+        self.stamp = time.monotonic()
+
+    def quiet_for(self):
+        return time.monotonic() - self.stamp
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The bot hanging up mid-response (e.g. when it is stopped) is expected
+        if not issubclass(sys.exc_info()[0], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _Server:
+    def __init__(self, handler, host="127.0.0.1", activity=None):
+        self.activity = activity or Activity()
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.httpd = _HTTPServer((host, 0), handler)
+        self.httpd.owner = self
+        self.host, self.port = host, self.httpd.server_port
+        self.url = "http://{}:{}".format(host, self.port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def owner(self):
+        return self.server.owner
+
+    def reply(self, status, body=b"", ctype="application/json", headers=()):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def params(self):
+        # Query string, form body or JSON body, whichever the client used
+        out = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        if raw[:1] in (b"{", b"["):
+            out.update(json.loads(raw))
+        elif raw:
+            out.update({k: v[0] for k, v in parse_qs(raw.decode()).items()})
+        return out
+
+    def log_message(self, *args):
+        pass
+
+
+# Feeds
+
+def make_feed(path, items=20, item_bytes=600, dup_rate=0.3, seed=0):
+    """Deterministic feed for `path`. The format follows the path's hash (RSS,
+    Atom or RDF); a share of titles comes from a pool common to all feeds so
+    deduplication has something to collapse."""
+    h = zlib.crc32(path.encode()) ^ seed
+    rng = random.Random(h)
+    shared = random.Random(seed)
+    pool = [" ".join(shared.choice(WORDS) for _ in range(8)) for _ in range(60)]
+    now = datetime.now(timezone.utc)
+    entries = []
+    for i in range(items):
+        title = rng.choice(pool) if rng.random() < dup_rate else " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12)))
+        pub = now - timedelta(minutes=rng.randint(1, 600))
+        link = "https://example.com/{:x}/{}".format(h, i)
+        body = " ".join(rng.choice(WORDS) for _ in range(max(1, item_bytes // 6)))[:item_bytes]
+        entries.append((title.capitalize(), link, pub, body))
+    kind, path = h % 3, escape(path)
+    if kind == 0:
+        items_xml = "".join(
+            "<item><title>{}</title><link>{}</link><guid>{}</guid><pubDate>{}</pubDate>"
+            "<description>{}</description></item>".format(t, l, l, format_datetime(p), b)
+            for t, l, p, b in entries)
+        xml = ('<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>{}</title>'
+               "<link>https://example.com</link><description>bench</description>{}</channel></rss>").format(path, items_xml)
+    elif kind == 1:
+        items_xml = "".join(
+            '<entry><title>{}</title><link href="{}"/><id>{}</id><updated>{}</updated>'
+            "<summary>{}</summary></entry>".format(t, l, l, p.isoformat(), b)
+            for t, l, p, b in entries)
+        xml = ('<?xml version="1.0" encoding="UTF-8"?><feed xmlns="http://www.w3.org/2005/Atom">'
+               "<title>{}</title><id>urn:bench</id><updated>{}</updated>{}</feed>").format(path, now.isoformat(), items_xml)
+    else:
+        items_xml = "".join(
+            '<item rdf:about="{}"><title>{}</title><link>{}</link><dc:date>{}</dc:date>'
+            "<description>{}</description></item>".format(l, t, l, p.isoformat(), b)
+            for t, l, p, b in entries)
+        xml = ('<?xml version="1.0" encoding="UTF-8"?><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" '
+               'xmlns="http://purl.org/rss/1.0/" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+               '<channel rdf:about="https://example.com"><title>{}</title><link>https://example.com</link>'
+               "<description>bench</description></channel>{}</rdf:RDF>").format(path, items_xml)
+    return xml.encode()
+
+
+class _FeedHandler(_Handler):
+    def do_GET(self):
+        o = self.owner
+        o.activity.touch()
+        path = urlparse(self.path).path
+        if path.startswith("/fng"):
+            o.count("fng")
+            self.reply(200, {"data": [{"value": "55", "value_classification": "Greed"}]})
+            return
+        if path.startswith("/calendar/economic"):
+            o.count("calendar")
+            self.reply(200, {"economicCalendar": [
+                {"time": "14:30", "event": "CPI YoY", "country": "US", "impact": "high"},
+                {"time": "16:00", "event": "ISM Services", "country": "US", "impact": "medium"},
+            ]})
+            return
+        o.count("requests")
+        if o.latency:
+            time.sleep(random.uniform(0.5, 1.5) * o.latency)
+        if random.random() < o.fail_rate:
+            o.count("failures")
+            self.reply(503, b"unavailable", "text/plain")
+            o.activity.touch()
+            return
+        body, etag = o.feed(self.path)
+        if o.etags and self.headers.get("If-None-Match") == etag:
+            o.count("not_modified")
+            self.reply(304, headers=[("ETag", etag)])
+        else:
+            o.count("bytes", len(body))
+            self.reply(200, body, "application/xml; charset=utf-8", [("ETag", etag)])
+        o.activity.touch()
+
+
+class FeedServer(_Server):
+    def __init__(self, host="127.0.0.1", items=20, item_bytes=600, latency=0.2, fail_rate=0.0,
+                 etags=True, dup_rate=0.3, seed=0, activity=None):
+        self.items, self.item_bytes, self.latency, self.fail_rate = items, item_bytes, latency, fail_rate
+        self.etags, self.dup_rate, self.seed = etags, dup_rate, seed
+        self._feeds = {}
+        super().__init__(_FeedHandler, host, activity)
+
+    def feed(self, path):
+        with self.lock:
+            cached = self._feeds.get(path)
+        if cached is None:
+            body = make_feed(path, self.items, self.item_bytes, self.dup_rate, self.seed)
+            cached = (body, '"{:08x}"'.format(zlib.crc32(body)))
+            with self.lock:
+                self._feeds[path] = cached
+        return cached
+
+
+# Groq
+
+class _GroqHandler(_Handler):
+    def do_POST(self):
+        o = self.owner
+        o.activity.touch()
+        body = self.params()
+        o.count("requests")
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        o.count("prompt_chars", len(prompt))
+        pieces = ["- Bench bullet {} about {} [link](https://example.com/{})\n".format(i, random.choice(WORDS), i)
+                  for i in range(o.chunks)]
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": sum(len(p) for p in pieces) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "bench", "created": int(time.time()), "model": body.get("model", "bench")}
+        time.sleep(o.ttft)
+        if not body.get("stream"):
+            time.sleep(o.chunk_delay * o.chunks)
+            self.reply(200, dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "".join(pieces)}}]))
+            o.activity.touch()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i, piece in enumerate(pieces):
+            chunk = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            if i == len(pieces) - 1:
+                chunk["choices"][0]["finish_reason"] = "stop"
+                chunk["x_groq"] = {"id": "bench", "usage": usage}
+            self.wfile.write(("data: " + json.dumps(chunk) + "\n\n").encode())
+            self.wfile.flush()
+            o.activity.touch()
+            time.sleep(o.chunk_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        o.activity.touch()
+
+
+class GroqServer(_Server):
+    """Answers every completion with `chunks` bullets: ttft seconds to the
+    first one, then chunk_delay seconds per bullet."""
+
+    def __init__(self, ttft=0.4, chunks=12, chunk_delay=0.08, activity=None):
+        self.ttft, self.chunks, self.chunk_delay = ttft, chunks, chunk_delay
+        super().__init__(_GroqHandler, activity=activity)
+
+
+# Telegram
+
+class _TelegramHandler(_Handler):
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        o = self.owner
+        method = urlparse(self.path).path.rsplit("/", 1)[-1]
+        params = self.params()
+        if method == "getUpdates":
+            self.reply(200, {"ok": True, "result": o.updates(int(params.get("offset", 0)),
+                                                             float(params.get("timeout", 0)))})
+            return
+        o.activity.touch()
+        o.count(method)
+        chat_id = params.get("chat_id")
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else chat_id
+            o.record(chat_id, method, params.get("text", ""))
+            with o.lock:
+                o.message_id += 1
+                mid = o.message_id if method == "sendMessage" else int(params.get("message_id", 0))
+            result = {"message_id": mid, "date": int(time.time()), "text": params.get("text", ""),
+                      "chat": {"id": chat_id, "type": "private"}}
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        else:
+            result = True
+        self.reply(200, {"ok": True, "result": result})
+
+
+class TelegramServer(_Server):
+    """Bot API stand-in. inject() queues a user message for getUpdates; every
+    message the bot sends or edits is recorded per chat with its timestamp."""
+
+    def __init__(self, activity=None):
+        self.message_id = 0
+        self._updates = []
+        self._update_id = 0
+        self._cond = threading.Condition()
+        self.first_poll = threading.Event()
+        self.delivered = {}   # { chat_id: time the bot received its command }
+        self.calls = {}       # { chat_id: [(time, method, text), ...] }
+        super().__init__(_TelegramHandler, activity=activity)
+
+    def inject(self, chat_id, text):
+        self.activity.touch()
+        with self._cond:
+            self._update_id += 1
+            self._updates.append({"update_id": self._update_id, "message": {
+                "message_id": self._update_id, "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "user{}".format(chat_id)},
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+            }})
+            self._cond.notify_all()
+
+    def updates(self, offset, timeout):
+        self.first_poll.set()
+        deadline = time.monotonic() + min(timeout, 10)
+        with self._cond:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            batch = list(self._updates)
+        now = time.monotonic()
+        for u in batch:
+            self.delivered.setdefault(u["message"]["chat"]["id"], now)
+        return batch
+
+    def record(self, chat_id, method, text):
+        with self.lock:
+            self.calls.setdefault(chat_id, []).append((time.monotonic(), method, text))
+
+
+# Hyperliquid
+
+def _trade(coin, tid):
+    return {"coin": coin, "side": random.choice("AB"), "px": "{:.2f}".format(random.uniform(1, 60000)),
+            "sz": "{:.3f}".format(random.uniform(0.01, 50)), "time": int(time.time() * 1000), "tid": tid,
+            "hash": "0x{:064x}".format(tid), "dir": random.choice(["Liquidated Long", "Liquidated Short", "Open Long"])}
+
+
+class _InfoHandler(_Handler):
+    def do_POST(self):
+        o = self.owner
+        body = self.params()
+        o.count("requests")
+        coin = body.get("coin", "BTC")
+        self.reply(200, [_trade(coin, o.next_tid()) for _ in range(5)])
+
+
+class HyperliquidServer(_Server):
+    def __init__(self, activity=None):
+        self._tid = 0
+        super().__init__(_InfoHandler, activity=activity)
+
+    def next_tid(self):
+        with self.lock:
+            self._tid += 1
+            return self._tid
+
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _ws_frame(opcode, payload):
+    head = bytes([0x80 | opcode])
+    n = len(payload)
+    if n < 126:
+        head += bytes([n])
+    elif n < 1 << 16:
+        head += bytes([126]) + struct.pack(">H", n)
+    else:
+        head += bytes([127]) + struct.pack(">Q", n)
+    return head + payload
+
+
+def _recv_exact(conn, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = conn.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("closed")
+        buf += chunk
+    return buf
+
+
+def _ws_read(conn):
+    b0, b1 = _recv_exact(conn, 2)
+    n = b1 & 0x7F
+    if n == 126:
+        n = struct.unpack(">H", _recv_exact(conn, 2))[0]
+    elif n == 127:
+        n = struct.unpack(">Q", _recv_exact(conn, 8))[0]
+    mask = _recv_exact(conn, 4) if b1 & 0x80 else b"\0\0\0\0"
+    data = _recv_exact(conn, n)
+    return b0 & 0x0F, bytes(c ^ mask[i % 4] for i, c in enumerate(data))
+
+
+class HyperliquidWS:
+    """Accepts the trades subscriptions and pushes a batch of trades for a
+    random subscribed coin every `interval` seconds."""
+
+    def __init__(self, interval=1.0, host="127.0.0.1"):
+        self.interval = interval
+        self.stats = {"connections": 0, "messages": 0}
+        self._tid = 10 ** 9
+        self.sock = socket.create_server((host, 0))
+        self.port = self.sock.getsockname()[1]
+        self.url = "ws://{}:{}/ws".format(host, self.port)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        closed = threading.Event()
+        try:
+            request = b""
+            while b"\r\n\r\n" not in request:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    return
+                request += chunk
+            headers = dict(line.split(": ", 1) for line in request.decode().split("\r\n")[1:] if ": " in line)
+            key = {k.lower(): v for k, v in headers.items()}["sec-websocket-key"].strip()
+            accept = base64.b64encode(hashlib.sha1(key.encode() + _WS_GUID).digest()).decode()
+            conn.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          "Sec-WebSocket-Accept: " + accept + "\r\n\r\n").encode())
+            self.stats["connections"] += 1
+            coins, send_lock = [], threading.Lock()
+
+            def send(opcode, payload):
+                with send_lock:
+                    conn.sendall(_ws_frame(opcode, payload))
+
+            def pusher():
+                while not closed.wait(self.interval):
+                    if coins:
+                        coin = random.choice(coins)
+                        self._tid += 3
+                        data = [_trade(coin, self._tid + i) for i in range(3)]
+                        try:
+                            send(0x1, json.dumps({"channel": "trades", "data": data}).encode())
+                        except OSError:
+                            return
+                        self.stats["messages"] += 1
+            threading.Thread(target=pusher, daemon=True).start()
+
+            while True:
+                opcode, payload = _ws_read(conn)
+                if opcode == 0x8:
+                    send(0x8, payload[:2])
+                    break
+                if opcode == 0x9:
+                    send(0xA, payload)
+                elif opcode == 0x1:
+                    msg = json.loads(payload)
+                    if msg.get("method") == "subscribe":
+                        coins.append(msg["subscription"]["coin"])
+                        send(0x1, json.dumps({"channel": "subscriptionResponse", "data": msg}).encode())
+                    elif msg.get("method") == "ping":
+                        send(0x1, b'{"channel": "pong"}')
+        except (OSError, ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            closed.set()
+            conn.close()
+
+    def close(self):
+        self.sock.close()
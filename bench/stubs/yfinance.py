@@ -0,0 +1,18 @@
+"""Offline stand-in for yfinance, put on PYTHONPATH by bench_e2e.py.
+
+Only download() is provided: deterministic closes per symbol after
+BENCH_YF_LATENCY seconds (default 0.5), shaped like the real batched frame.
+"""
+import os, time, zlib
+import pandas as pd
+
+
+def download(tickers, period="5d", interval="1d", **kwargs):
+    time.sleep(float(os.getenv("BENCH_YF_LATENCY", "0.5")))
+    symbols = tickers.split() if isinstance(tickers, str) else list(tickers)
+    index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=5, freq="D")
+    data = {}
+    for symbol in symbols:
+        base = 50 + zlib.crc32(symbol.encode()) % 5000
+        data[("Close", symbol)] = [base * (1 + 0.01 * ((i * 7 + base) % 5 - 2)) for i in range(5)]
+    return pd.DataFrame(data, index=index)
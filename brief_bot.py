@@ -1,19 +1,30 @@
-import os, json, re, time, threading, feedparser, requests, yfinance as yf, logging
+import os, sys, json, re, atexit, signal, time, random, queue, threading, zlib, hashlib, sqlite3, requests, logging
+import heapq, html, socket
+import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from zoneinfo import ZoneInfo
+from array import array
+from collections import OrderedDict, deque
 from difflib import SequenceMatcher
+from concurrent.futures import Future, ThreadPoolExecutor, wait, TimeoutError as FuturesTimeout
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 import telebot
-from groq import Groq
-from apscheduler.schedulers.background import BackgroundScheduler
-import websocket
+
+# Importing this module has no side effects beyond reading config: main()
+# creates the bot and starts every thread. feedparser, yfinance (pandas),
+# groq and websocket are imported on first use.
+_STARTED = time.monotonic()
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
-bot = telebot.TeleBot(os.getenv("TELEGRAM_TOKEN"))
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+bot = None      # telebot.TeleBot, created by create_bot()
+_client = None  # Groq client, created on first summary
+_client_lock = threading.Lock()
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
 CHANNEL_ID = os.getenv("CHANNEL_ID")
 
 # Your self-hosted RSSHub base URL on Railway
@@ -23,6 +34,18 @@ RSSHUB_URL = os.getenv("RSSHUB_URL", "https://your-rsshub-url.railway.app")
 ACLED_EMAIL    = os.getenv("ACLED_EMAIL", "")
 ACLED_PASSWORD = os.getenv("ACLED_PASSWORD", "")
 _acled_session = None   # requests.Session, populated lazily
+ACLED_API_URL   = os.getenv("ACLED_API_URL", "https://acleddata.com/api/acled/read")
+ACLED_LOGIN_URL = os.getenv("ACLED_LOGIN_URL", "https://acleddata.com/user/login?_format=json")
+# Events are pulled into the acled_events table every ACLED_SYNC_MINUTES, only
+# those added or revised since the last sync, ACLED_PAGE_SIZE per request.
+# ACLED publishes with a lag, so each sync covers ACLED_LOOKBACK_DAYS of event dates.
+ACLED_SYNC_MINUTES   = int(os.getenv("ACLED_SYNC_MINUTES", "30"))
+ACLED_LOOKBACK_DAYS  = int(os.getenv("ACLED_LOOKBACK_DAYS", "3"))
+ACLED_PAGE_SIZE      = 1000
+ACLED_MAX_PAGES      = 20
+ACLED_RETENTION_DAYS = 7
+ACLED_BRIEF_EVENTS   = int(os.getenv("ACLED_BRIEF_EVENTS", "20"))   # most severe events ranked into /geo
+ACLED_EVENT_TYPES    = "Battles|Explosions/Remote violence|Violence against civilians"
 
 # Feeds
 
@@ -78,134 +101,1614 @@ NEWSLETTER_FEEDS = [
     ("Bankless",          "https://www.bankless.com/feed"),
 ]
 
-LAST_BRIEF_FILE = "last_brief.txt"
-
-# Push-notification accounts -- polled every 10 min, alert sent immediately
+# FEEDS_CONFIG: JSON file replacing any of the lists above, e.g. to point the
+# bot at local stand-ins -- {"osint": [url, ...], "market": [...], "tech": [...],
+# "newsletters": [[name, url], ...]}
+if os.getenv("FEEDS_CONFIG"):
+    with open(os.getenv("FEEDS_CONFIG")) as _f:
+        _feeds_config = json.load(_f)
+    OSINT_FEEDS = _feeds_config.get("osint", OSINT_FEEDS)
+    MARKET_FEEDS = _feeds_config.get("market", MARKET_FEEDS)
+    TECH_FEEDS = _feeds_config.get("tech", TECH_FEEDS)
+    NEWSLETTER_FEEDS = [tuple(f) for f in _feeds_config.get("newsletters", NEWSLETTER_FEEDS)]
+
+# All mutable state -- last brief time, delivered headlines, subscribers, push
+# ids, liquidations, snapshots and the feed / summary caches -- lives in one
+# SQLite file, so a restart picks up where the last process left off.
+STATE_DB             = os.getenv("STATE_DB", "state.db")
+STATE_FLUSH_SECONDS  = float(os.getenv("STATE_FLUSH_SECONDS", "1"))   # writes are committed in batches this often
+STATE_PRUNE_MINUTES  = 60
+# Headlines already delivered in a scheduled brief are fingerprinted so the
+# next brief only carries (and pays Groq for) new stories
+SENT_RETENTION_HOURS = int(os.getenv("SENT_RETENTION_HOURS", "72"))
+# File older versions kept the last brief time in; imported into STATE_DB once and renamed
+LEGACY_LAST_BRIEF_FILE = "last_brief.txt"
+
+# Feed fetch stage -- all feeds of a brief are fetched on a bounded pool,
+# with at most FEED_PER_HOST requests in flight per host (RSSHub serves most
+# of the twitter feeds) and an overall deadline after which we go with
+# whatever has arrived. The per-host limit is applied before a fetch goes
+# to the pool: a host's extra fetches wait in its own queue, so they never
+# hold pool threads that feeds from other hosts could use.
+FEED_WORKERS  = int(os.getenv("FEED_WORKERS", "16"))
+FEED_PER_HOST = int(os.getenv("FEED_PER_HOST", "4"))
+FEED_DEADLINE = float(os.getenv("FEED_DEADLINE", "20"))
+
+_feed_pool = ThreadPoolExecutor(max_workers=FEED_WORKERS, thread_name_prefix="feed")
+_brief_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="brief")
+_host_active = {}    # { host: fetches submitted to _feed_pool }
+_host_pending = {}   # { host: deque of (Future, url, max_entries) }
+_host_lock = threading.Lock()
+
+# Every feed request goes through a keep-alive session per host with connect
+# and read timeouts, an overall time limit and a size cap. A feed that fails
+# (or takes over FEED_SLOW_SECONDS) FEED_BREAKER_FAILURES times in a row is
+# skipped for FEED_BREAKER_COOLDOWN seconds, then probed again.
+FEED_CONNECT_TIMEOUT  = float(os.getenv("FEED_CONNECT_TIMEOUT", "5"))
+FEED_READ_TIMEOUT     = float(os.getenv("FEED_READ_TIMEOUT", "10"))
+FEED_MAX_BYTES        = int(os.getenv("FEED_MAX_BYTES", str(2 * 1024 * 1024)))
+FEED_SLOW_SECONDS     = float(os.getenv("FEED_SLOW_SECONDS", "8"))
+FEED_BREAKER_FAILURES = int(os.getenv("FEED_BREAKER_FAILURES", "3"))
+FEED_BREAKER_COOLDOWN = int(os.getenv("FEED_BREAKER_COOLDOWN", "900"))
+FEED_WATCH_TICK       = 0.25   # how often the watchdog looks for fetches past their time limit
+FEED_USER_AGENT       = "Mozilla/5.0 (compatible; CoffeeBrief/1.0)"
+
+# RSS, Atom and RDF are parsed as they stream in, keeping only title, link, id
+# and date. Reading stops once a feed has given max_entries entries, or
+# FEED_STALE_RUN in a row older than FEED_HORIZON_HOURS (no brief looks further
+# back). Feeds the streaming parser can't read go through feedparser instead.
+FEED_HORIZON_HOURS = 24
+FEED_STALE_RUN     = 3
+_feed_sessions = {}   # { host: requests.Session }
+_feed_health = {}     # { url: {"ok", "failed", "slow", "streak", "open_until", "last_error", "last_seconds", "bytes"} }
+_feed_health_lock = threading.Lock()
+
+# Conditional-GET feed cache -- per URL we keep the ETag / Last-Modified the
+# server sent plus the slimmed entries, so an unchanged feed costs one 304 and
+# no parsing. LRU-bounded and kept in the feed_cache table across restarts.
+FEED_CACHE_MAX = int(os.getenv("FEED_CACHE_MAX", "200"))   # feeds kept
+_feed_cache = OrderedDict()   # { url: {"etag": str, "modified": str, "entries": [...]} }
+_feed_cache_lock = threading.Lock()
+
+# Summary cache -- Groq output keyed on the headlines it was given, LRU with a
+# TTL, kept in the summary_cache table
+SUMMARY_CACHE_MAX = int(os.getenv("SUMMARY_CACHE_MAX", "200"))
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", str(6 * 3600)))
+
+# Push-notification accounts -- alert sent as soon as a new post is seen.
+# More can be added with PUSH_ACCOUNTS="handle:geo,other:market".
 PUSH_ACCOUNTS = [
     ("SITREP_artorias", "geo"),
 ]
-# Tracks the most-recent tweet ID seen per account so we don't re-alert
-_push_seen = {}   # { "SITREP_artorias": set_of_ids, ... }
+PUSH_ACCOUNTS += [tuple((a.split(":", 1) + ["geo"])[:2]) for a in os.getenv("PUSH_ACCOUNTS", "").replace(" ", "").split(",") if a]
+# Each account is polled on its own interval: PUSH_MIN_INTERVAL right after it
+# posted, stretched by PUSH_BACKOFF after every quiet poll up to PUSH_MAX_INTERVAL.
+# Due accounts are picked up every PUSH_TICK seconds and polled concurrently,
+# still within FEED_PER_HOST requests at a time against RSSHub.
+PUSH_MIN_INTERVAL = int(os.getenv("PUSH_MIN_INTERVAL", "40"))
+# Idle accounts settle at one poll per 10 minutes, so RSSHub sees no more
+# load than a flat 10-minute poll (a 304 still costs it a route render);
+# lowering PUSH_MAX_INTERVAL trades that load for faster alerts after a lull.
+PUSH_MAX_INTERVAL = int(os.getenv("PUSH_MAX_INTERVAL", "600"))
+PUSH_BACKOFF      = 1.5
+PUSH_TICK         = 10
+PUSH_WORKERS      = int(os.getenv("PUSH_WORKERS", "8"))
+PUSH_ENTRIES      = 10
+PUSH_SEEN_MAX     = 200          # ids remembered per account
+PUSH_MAX_AGE      = 6 * 3600     # older posts (e.g. from before a long outage) are not alerted
+# Ids already seen per account, backed by the push_seen table so restarts
+# neither re-seed nor re-alert
+_push_seen = {}    # { "SITREP_artorias": BoundedSet of ids, ... }
+_push_state = {}   # { handle: {"interval": s, "due": ts, "busy": bool} }
+_push_lock = threading.Lock()
 
 # Hyperliquid liquidations
 LIQ_THRESHOLDS = {"BTC": 200000, "ETH": 200000, "SOL": 100000}
 DEFAULT_LIQ_THRESHOLD = 50000
-METALS_THRESHOLD = 150000
 
-liq_cache = []
-liq_lock = threading.Lock()
+# Real-time alerts: a single liquidation at or above the coin's threshold, or a
+# cascade -- LIQ_CASCADE_MULTIPLE thresholds' worth inside LIQ_CASCADE_WINDOW
+# seconds. Each (coin, kind) is muted for LIQ_ALERT_COOLDOWN afterwards, and
+# alerts firing within LIQ_ALERT_BATCH seconds go out as one message.
+LIQ_CASCADE_WINDOW   = int(os.getenv("LIQ_CASCADE_WINDOW", "60"))
+LIQ_CASCADE_MULTIPLE = float(os.getenv("LIQ_CASCADE_MULTIPLE", "5"))
+LIQ_ALERT_COOLDOWN   = int(os.getenv("LIQ_ALERT_COOLDOWN", "300"))
+LIQ_ALERT_BATCH      = float(os.getenv("LIQ_ALERT_BATCH", "5"))
+LIQ_ALERT_MAX_AGE    = 600   # REST backfill older than this is stored but not alerted
+
+# Liquidations go into a fixed-size columnar ring buffer; per-coin long/short
+# sums for the LIQ_WINDOWS horizons are kept current as rows enter and age out,
+# so the digest never rescans the buffer.
+LIQ_CAPACITY = int(os.getenv("LIQ_CAPACITY", "100000"))
+LIQ_WINDOWS  = (1, 4, 12, 24)   # hours
+LIQ_MAX_HOURS = 168             # longest window /liqs accepts; kept and restored across restarts
+
+
+class BoundedSet:
+    """Set that remembers only the `maxlen` most recently added items."""
+
+    def __init__(self, maxlen, items=()):
+        self.maxlen = maxlen
+        self._order = deque()
+        self._items = set()
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def add(self, item):
+        """Add item, evicting the oldest past maxlen. Returns False if it was already present."""
+        if item in self._items:
+            return False
+        self._items.add(item)
+        self._order.append(item)
+        if len(self._order) > self.maxlen:
+            self._items.discard(self._order.popleft())
+        return True
+
+
+class LiqStore:
+    """Ring buffer of liquidations held as parallel columns: ts, coin id,
+    notional and side (1 = long liquidated, -1 = short liquidated).
+
+    Rows are addressed by an ever-increasing sequence number; seq % capacity
+    is the slot. Timestamps are kept non-decreasing so a window's first row
+    can be found by bisection. For every tracked window a tail pointer marks
+    the oldest row still inside it and the per-coin sums are debited as the
+    tail advances."""
+
+    def __init__(self, capacity=LIQ_CAPACITY, windows=LIQ_WINDOWS):
+        self.capacity = capacity
+        self.ts = array("d", [0.0]) * capacity
+        self.coin = array("H", [0]) * capacity
+        self.ntl = array("d", [0.0]) * capacity
+        self.side = array("b", [0]) * capacity
+        self.start = 0   # seq of the oldest row kept
+        self.end = 0     # seq of the next row
+        self.coins = []  # coin id -> name
+        self._coin_ids = {}
+        self._last_ts = 0.0
+        self.lock = threading.Lock()
+        self._windows = {
+            h: {"tail": 0, "long": array("d"), "short": array("d"), "long_n": array("L"), "short_n": array("L")}
+            for h in windows
+        }
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _coin_id(self, coin):
+        cid = self._coin_ids.get(coin)
+        if cid is None:
+            cid = self._coin_ids[coin] = len(self.coins)
+            self.coins.append(coin)
+            for w in self._windows.values():
+                w["long"].append(0.0)
+                w["short"].append(0.0)
+                w["long_n"].append(0)
+                w["short_n"].append(0)
+        return cid
+
+    def _apply(self, w, seq, sign):
+        slot = seq % self.capacity
+        cid, ntl = self.coin[slot], self.ntl[slot]
+        if self.side[slot] > 0:
+            w["long"][cid] += sign * ntl
+            w["long_n"][cid] += sign
+        else:
+            w["short"][cid] += sign * ntl
+            w["short_n"][cid] += sign
+
+    def _expire(self, now):
+        for hours, w in self._windows.items():
+            cutoff = now - hours * 3600
+            while w["tail"] < self.end and self.ts[w["tail"] % self.capacity] < cutoff:
+                self._apply(w, w["tail"], -1)
+                w["tail"] += 1
+
+    def add(self, ts, coin, notional, is_long):
+        with self.lock:
+            ts = max(ts, self._last_ts)
+            self._last_ts = ts
+            cid = self._coin_id(coin)
+            if self.end - self.start == self.capacity:
+                # Overwriting the oldest row: drop it from any window still counting it
+                for w in self._windows.values():
+                    if w["tail"] == self.start:
+                        self._apply(w, self.start, -1)
+                        w["tail"] += 1
+                self.start += 1
+            slot = self.end % self.capacity
+            self.ts[slot] = ts
+            self.coin[slot] = cid
+            self.ntl[slot] = notional
+            self.side[slot] = 1 if is_long else -1
+            self.end += 1
+            for w in self._windows.values():
+                self._apply(w, self.end - 1, 1)
+            self._expire(time.time())
+
+    def _first_after(self, cutoff):
+        lo, hi = self.start, self.end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[mid % self.capacity] < cutoff:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def window(self, hours):
+        """Per-coin totals over the last `hours`:
+        { coin: {"long_usd", "short_usd", "long_n", "short_n"} } for coins with activity."""
+        with self.lock:
+            now = time.time()
+            self._expire(now)
+            w = self._windows.get(hours)
+            if w is None:
+                # Untracked window: sum only the rows inside it
+                w = {"long": array("d", [0.0]) * len(self.coins), "short": array("d", [0.0]) * len(self.coins),
+                     "long_n": array("L", [0]) * len(self.coins), "short_n": array("L", [0]) * len(self.coins)}
+                for seq in range(self._first_after(now - hours * 3600), self.end):
+                    self._apply(w, seq, 1)
+            out = {}
+            for cid, coin in enumerate(self.coins):
+                if w["long_n"][cid] or w["short_n"][cid]:
+                    out[coin] = {
+                        "long_usd": w["long"][cid], "short_usd": w["short"][cid],
+                        "long_n": w["long_n"][cid], "short_n": w["short_n"][cid],
+                    }
+            return out
+
+
+liq_store = LiqStore()
+_liq_seen_tids = BoundedSet(5000)
+
+
+# Liquidation alerts
+
+_liq_cascades = {}   # { coin: [deque of (ts, notional), running_sum] }
+_liq_cooldown = {}   # { (coin, kind): ts of last alert }
+_liq_pending = []    # alert lines waiting for the batch flush
+_liq_alert_lock = threading.Lock()
+
+
+def liq_threshold(coin):
+    return LIQ_THRESHOLDS.get(coin, DEFAULT_LIQ_THRESHOLD)
+
+
+def _flush_liq_alerts():
+    with _liq_alert_lock:
+        lines = list(_liq_pending)
+        _liq_pending.clear()
+    if not lines or not CHANNEL_ID:
+        return
+    title = "\U0001f4a5 *Liquidation alert*" if len(lines) == 1 else "\U0001f4a5 *Liquidation alerts ({})*".format(len(lines))
+    tg_send(CHANNEL_ID, title + "\n" + "\n".join(lines))
+
+
+def _queue_liq_alert(line):
+    with _liq_alert_lock:
+        _liq_pending.append(line)
+        first = len(_liq_pending) == 1
+    if first:
+        timer = threading.Timer(LIQ_ALERT_BATCH, _flush_liq_alerts)
+        timer.daemon = True
+        timer.start()
+
+
+def check_liq_alert(coin, ts, notional, is_long):
+    """Evaluate one liquidation against the size and cascade rules. O(1) amortized."""
+    threshold = liq_threshold(coin)
+    fired = []
+    if notional >= threshold:
+        fired.append(("size", "{} *#{}* {} liquidated: {}".format(
+            "\U0001f534" if is_long else "\U0001f7e2", coin, "long" if is_long else "short", _fmt_usd(notional))))
+
+    window = _liq_cascades.get(coin)
+    if window is None:
+        window = _liq_cascades[coin] = [deque(), 0.0]
+    events = window[0]
+    events.append((ts, notional))
+    window[1] += notional
+    while events and events[0][0] < ts - LIQ_CASCADE_WINDOW:
+        window[1] -= events.popleft()[1]
+    if window[1] >= threshold * LIQ_CASCADE_MULTIPLE:
+        fired.append(("cascade", "\U0001f30a *#{}* cascade: {} liquidated in {}s ({} events)".format(
+            coin, _fmt_usd(window[1]), LIQ_CASCADE_WINDOW, len(events))))
+
+    if not fired or time.time() - ts > LIQ_ALERT_MAX_AGE:
+        return
+    now = time.time()
+    for kind, line in fired:
+        if now - _liq_cooldown.get((coin, kind), 0) >= LIQ_ALERT_COOLDOWN:
+            _liq_cooldown[(coin, kind)] = now
+            _queue_liq_alert(line)
+
+# Trades stream over WebSocket; REST polling only covers the gaps while the
+# socket is down. Both URLs can point at a local stand-in for testing.
+HYPERLIQUID_API_URL = os.getenv("HYPERLIQUID_API_URL", "https://api.hyperliquid.xyz/info")
+HYPERLIQUID_WS_URL  = os.getenv("HYPERLIQUID_WS_URL", "wss://api.hyperliquid.xyz/ws")
+LIQ_COINS = ["BTC", "ETH", "SOL", "XRP", "HYPE", "WIF", "DOGE", "AVAX", "ARB", "SUI", "BNB", "LINK", "ADA"]
+LIQ_WS_MAX_BACKOFF = 120
+LIQ_WS_HEARTBEAT = 50   # Hyperliquid drops sockets that are silent for 60s
+
+
+def _record_trade(coin, t):
+    # Liquidations have "dir" field like "Liquidated Long" or "Liquidated Short"
+    direction = t.get("dir", "")
+    if "Liquidated" not in direction:
+        return
+    if not _liq_seen_tids.add(t.get("tid")):
+        return
+    try:
+        notional = float(t.get("sz", 0)) * float(t.get("px", 0))
+    except (TypeError, ValueError):
+        return
+    ts = t["time"] / 1000.0 if t.get("time") else time.time()
+    liq_store.add(ts, coin, notional, "Long" in direction)
+    state_write("INSERT OR IGNORE INTO liquidations (tid, ts, coin, notional, is_long) VALUES (?, ?, ?, ?, ?)",
+                [(t.get("tid"), ts, coin, notional, int("Long" in direction))])
+    check_liq_alert(coin, ts, notional, "Long" in direction)
+
+
+def _restore_liquidations():
+    # Refill the ring buffer (and the seen tids) from the last LIQ_MAX_HOURS
+    # hours, without alerting, so a restart doesn't reset the digest
+    try:
+        rows = _db().execute("SELECT tid, ts, coin, notional, is_long FROM liquidations WHERE ts >= ? ORDER BY ts",
+                             (time.time() - LIQ_MAX_HOURS * 3600,)).fetchall()
+    except Exception as e:
+        log.warning("Liquidation restore failed: %s", e)
+        return
+    for tid, ts, coin, notional, is_long in rows:
+        _liq_seen_tids.add(tid)
+        liq_store.add(ts, coin, notional, bool(is_long))
+    log.info("Restored %d liquidations", len(rows))
+
+
+def _poll_hyperliquid_once():
+    """One REST sweep of recentTrades for every coin."""
+    for coin in LIQ_COINS:
+        resp = requests.post(HYPERLIQUID_API_URL, json={"type": "recentTrades", "coin": coin}, timeout=10)
+        if resp.status_code != 200:
+            continue
+        for t in resp.json():
+            _record_trade(coin, t)
 
 
-def _poll_hyperliquid_liquidations():
-    """Poll Hyperliquid REST API for recent liquidation trades every 2 minutes."""
-    global _liq_seen_tids
-    # Fetch trades for major coins and filter for liquidations
-    COINS = ["BTC", "ETH", "SOL", "XRP", "HYPE", "WIF", "DOGE", "AVAX", "ARB", "SUI", "BNB", "LINK", "ADA"]
+def _on_ws_message(ws, raw):
+    try:
+        msg = json.loads(raw)
+    except ValueError:
+        return
+    if msg.get("channel") != "trades":
+        return
+    for t in msg.get("data", []):
+        _record_trade(t.get("coin", "?"), t)
+
+
+def _run_hyperliquid_ws():
+    """Stream trades until the socket drops. Returns True if it ever connected."""
+    opened = threading.Event()
+
+    def on_open(ws):
+        opened.set()
+        for coin in LIQ_COINS:
+            ws.send(json.dumps({"method": "subscribe", "subscription": {"type": "trades", "coin": coin}}))
+        log.info("Hyperliquid WebSocket subscribed to %d coins", len(LIQ_COINS))
+
+        def heartbeat():
+            while ws.sock and ws.sock.connected:
+                time.sleep(LIQ_WS_HEARTBEAT)
+                try:
+                    ws.send(json.dumps({"method": "ping"}))
+                except Exception:
+                    return
+        threading.Thread(target=heartbeat, daemon=True).start()
+
+    import websocket
+    ws = websocket.WebSocketApp(
+        HYPERLIQUID_WS_URL,
+        on_open=on_open,
+        on_message=_on_ws_message,
+        on_error=lambda ws, e: log.warning("Hyperliquid WebSocket error: %s", e),
+    )
+    ws.run_forever(ping_interval=30, ping_timeout=10)
+    return opened.is_set()
+
+
+def _hyperliquid_ingester():
+    """Keep the trade stream up; while it is down, poll REST and back off exponentially."""
+    _restore_liquidations()
+    backoff = 1
     while True:
         try:
-            for coin in COINS:
-                resp = requests.post(
-                    "https://api.hyperliquid.xyz/info",
-                    json={"type": "recentTrades", "coin": coin},
-                    timeout=10
-                )
-                if resp.status_code != 200:
-                    continue
-                trades = resp.json()
-                for t in trades:
-                    # Liquidations have "dir" field like "Liquidated Long" or "Liquidated Short"
-                    tid = t.get("tid")
-                    direction = t.get("dir", "")
-                    if "Liquidated" not in direction:
-                        continue
-                    if tid in _liq_seen_tids:
-                        continue
-                    _liq_seen_tids.add(tid)
-                    # Keep set bounded
-                    if len(_liq_seen_tids) > 2000:
-                        _liq_seen_tids = set(list(_liq_seen_tids)[-1000:])
-                    entry = {
-                        "coin": coin,
-                        "px": t.get("px", "0"),
-                        "sz": t.get("sz", "0"),
-                        "side": "SELL" if "Long" in direction else "BUY",
-                        "dir": direction,
-                        "tid": tid,
-                        "user": t.get("users", ["", ""])[0] if t.get("users") else "",
-                    }
-                    with liq_lock:
-                        liq_cache.append(entry)
-                        if len(liq_cache) > 500:
-                            liq_cache.pop(0)
-            time.sleep(120)
+            if _run_hyperliquid_ws():
+                backoff = 1
+        except Exception as e:
+            log.error("Hyperliquid WebSocket failed: %s", e)
+        try:
+            _poll_hyperliquid_once()
         except Exception as e:
             log.error("Hyperliquid liq poll error: %s", e)
-            time.sleep(30)
+        log.info("Hyperliquid WebSocket down, reconnecting in %ds", backoff)
+        time.sleep(backoff)
+        backoff = min(backoff * 2, LIQ_WS_MAX_BACKOFF)
+
+
+
+
+# Metrics
+# In-process counters and latency histograms per stage -- feeds, dedup, quotes,
+# ACLED, Groq, Telegram, snapshot builds (and their single-flight coalescing)
+# and commands. /stats shows a summary to ADMIN_IDS; with METRICS_PORT set
+# they are also served as Prometheus text on 127.0.0.1:METRICS_PORT/metrics.
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(",", " ").split()}
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRIC_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_counters = {}      # { (name, labels): value }
+_histograms = {}    # { (name, labels): [bucket counts..., +Inf count, sum] }
+_metrics_lock = threading.Lock()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(labels))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = (name, _labels(labels))
+    with _metrics_lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(METRIC_BUCKETS) + 2)
+        for i, bound in enumerate(METRIC_BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[-2] += 1
+        h[-1] += seconds
+
+
+class timed:
+    """with timed("stage_seconds", stage="dedup"): ... -- observes the block's duration."""
+
+    def __init__(self, name, **labels):
+        self.name, self.labels = name, labels
+
+    def __enter__(self):
+        self.t0 = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.monotonic() - self.t0, **self.labels)
+
+
+def _quantile(h, q):
+    # Upper bound of the bucket holding the q-th observation
+    rank = q * h[-2]
+    for i, bound in enumerate(METRIC_BUCKETS):
+        if h[i] >= rank:
+            return bound
+    return float("inf")
+
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs) + "}"
+
+
+def metrics_text():
+    """All metrics in the Prometheus text exposition format."""
+    with _metrics_lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, list(v)) for k, v in _histograms.items())
+    out, typed = [], set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            out.append("# TYPE " + name + " counter")
+        out.append(name + _fmt_labels(labels) + " " + str(value))
+    for (name, labels), h in histograms:
+        if name not in typed:
+            typed.add(name)
+            out.append("# TYPE " + name + " histogram")
+        for i, bound in enumerate(METRIC_BUCKETS):
+            out.append(name + "_bucket" + _fmt_labels(labels, [("le", str(bound))]) + " " + str(h[i]))
+        out.append(name + "_bucket" + _fmt_labels(labels, [("le", "+Inf")]) + " " + str(h[-2]))
+        out.append(name + "_count" + _fmt_labels(labels) + " " + str(h[-2]))
+        out.append(name + "_sum" + _fmt_labels(labels) + " " + "{:.6f}".format(h[-1]))
+    return "\n".join(out) + "\n"
+
+
+def stats_summary():
+    """Compact per-stage summary for /stats: count, mean and p95 per histogram
+    (per-feed series folded together), then the counters."""
+    with _metrics_lock:
+        folded = {}
+        for (name, labels), h in _histograms.items():
+            key = name + _fmt_labels([kv for kv in labels if kv[0] != "feed"])
+            acc = folded.setdefault(key, [0] * (len(METRIC_BUCKETS) + 2))
+            for i, v in enumerate(h):
+                acc[i] += v
+        totals = {}
+        for (name, labels), value in _counters.items():
+            key = name + _fmt_labels([kv for kv in labels if kv[0] != "feed"])
+            totals[key] = totals.get(key, 0) + value
+    lines = []
+    for key, h in sorted(folded.items()):
+        if h[-2]:
+            lines.append("{}  n={} avg={:.2f}s p95<={}s".format(key, h[-2], h[-1] / h[-2], _quantile(h, 0.95)))
+    for key, value in sorted(totals.items()):
+        lines.append("{}  {}".format(key, value))
+    return "\n".join(lines) or "No metrics yet."
+
+
+def start_metrics_server(port=METRICS_PORT):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    log.info("Metrics on http://127.0.0.1:%d/metrics", port)
+    return server
 
 
-threading.Thread(target=_poll_hyperliquid_liquidations, daemon=True).start()
-log.info("Hyperliquid liquidation poller started")
+# Helpers
 
+# Outbound Telegram traffic goes through token buckets -- TG_GLOBAL_RATE
+# messages/s overall and a per-chat rate (groups and channels are limited to
+# 20/min) -- and 429s are retried after the retry_after Telegram sends back.
+# tg_send only enqueues. Each chat has its own FIFO and is scheduled in exactly
+# one place at a time -- the ready queue, the delay heap or a worker -- which
+# keeps its messages in order. A chat whose bucket is empty, or that got a
+# 429, goes onto the delay heap until it may send again, so the workers never
+# sleep on one chat while others wait.
+TG_GLOBAL_RATE  = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE    = 1.0
+TG_GROUP_RATE   = 20 / 60
+TG_SEND_WORKERS = int(os.getenv("TG_SEND_WORKERS", "8"))
+TG_MAX_CHUNK    = 4000
+TG_MAX_RETRIES  = 5
+
+
+class TokenBucket:
+    """Classic token bucket; take() blocks until a token is available,
+    try_take() only takes one if it is there right now."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def try_take(self):
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def wait_time(self):
+        """Seconds until a token will be available."""
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+_global_bucket = TokenBucket(TG_GLOBAL_RATE, burst=TG_GLOBAL_RATE)
+_chat_buckets = {}
+_chat_buckets_lock = threading.Lock()
+
+
+def _is_private(chat_id):
+    # Private chats have positive ids; groups, channels and "@channel" names don't
+    return str(chat_id).isdigit()
+
+
+def _chat_bucket(chat_id):
+    with _chat_buckets_lock:
+        bucket = _chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = TG_CHAT_RATE if _is_private(chat_id) else TG_GROUP_RATE
+            bucket = _chat_buckets[chat_id] = TokenBucket(rate, burst=3)
+        return bucket
+
+
+def tg_call(chat_id, fn, *args, **kwargs):
+    """Run one Bot API call that may be dropped, only if the rate limits allow it
+    right now: with no token free in either bucket, or on a 429, it returns None
+    without waiting. Anything that must arrive goes through the send queue."""
+    if not (_chat_bucket(chat_id).try_take() and _global_bucket.try_take()):
+        inc("telegram_skipped_total", method=fn.__name__)
+        return None
+    try:
+        return _tg_request(fn, *args, **kwargs)
+    except telebot.apihelper.ApiTelegramException as e:
+        if e.error_code == 429:
+            return None
+        raise
+
+
+def _tg_request(fn, *args, **kwargs):
+    # One Bot API call with its metrics; the caller has already taken the tokens
+    t0 = time.monotonic()
+    try:
+        return fn(*args, **kwargs)
+    except telebot.apihelper.ApiTelegramException as e:
+        inc("telegram_errors_total", code=e.error_code)
+        if e.error_code == 429:
+            inc("telegram_429_total")
+        raise
+    finally:
+        observe("telegram_request_seconds", time.monotonic() - t0, method=fn.__name__)
+
+
+def _retry_after(e):
+    return (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+
+
+_LINK_RE = re.compile(r"\[[^\]\n]*\]\([^)\s]*\)")
+
+
+def _cut_point(line, limit):
+    # Last space before limit that is not inside a [text](url) link
+    cut = line.rfind(" ", 0, limit)
+    for m in _LINK_RE.finditer(line):
+        if m.start() < cut < m.end():
+            cut = line.rfind(" ", 0, m.start())
+            break
+        if m.start() >= limit:
+            break
+    return cut if cut > 0 else limit
+
+
+def split_message(text, limit=TG_MAX_CHUNK):
+    """Split text into chunks of at most `limit` chars on line boundaries,
+    falling back to spaces (outside links) for overlong lines."""
+    chunks, current = [], ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            cut = _cut_point(line, limit)
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:cut])
+            line = line[cut:].lstrip(" ")
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = current + "\n" + line if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def markdown_ok(text):
+    """True if text should parse as Telegram legacy Markdown: links well formed,
+    and *, _ and ` balanced outside links and code spans."""
+    rest = re.sub(r"`[^`]*`", "", _LINK_RE.sub("", text))
+    return "[" not in rest and "`" not in rest and rest.count("*") % 2 == 0 and rest.count("_") % 2 == 0
+
+
+_chat_queues = {}          # { chat_id: deque of [call, args, kwargs, attempts] }
+_chat_queues_lock = threading.Lock()
+_send_ready = queue.Queue()   # chat ids that may send now
+_send_delayed = []            # heap of (monotonic time, seq, chat_id)
+_send_delayed_cond = threading.Condition()
+_send_seq = 0
+
+
+def _defer(chat_id, delay):
+    global _send_seq
+    with _send_delayed_cond:
+        _send_seq += 1
+        heapq.heappush(_send_delayed, (time.monotonic() + delay, _send_seq, chat_id))
+        _send_delayed_cond.notify()
+
+
+def _send_timer():
+    # Moves deferred chats back to the ready queue once their time has come
+    while True:
+        with _send_delayed_cond:
+            while not _send_delayed or _send_delayed[0][0] > time.monotonic():
+                _send_delayed_cond.wait(_send_delayed[0][0] - time.monotonic() if _send_delayed else None)
+            _, _, chat_id = heapq.heappop(_send_delayed)
+        _send_ready.put(chat_id)
+
+
+def _send_next(chat_id):
+    """Try the head of chat_id's queue. Returns the seconds to wait before
+    trying this chat again, or None once its queue is empty."""
+    with _chat_queues_lock:
+        item = _chat_queues[chat_id][0]
+    bucket = _chat_bucket(chat_id)
+    if not bucket.try_take():
+        return bucket.wait_time()
+    _global_bucket.take()   # shared by every chat and refilling at TG_GLOBAL_RATE/s: short waits only
+    call, args, kwargs, attempts = item
+    try:
+        # A Bot method name, or a function making its own calls through _tg_request
+        if isinstance(call, str):
+            _tg_request(getattr(bot, call), *args, **kwargs)
+        else:
+            call(*args, **kwargs)
+    except telebot.apihelper.ApiTelegramException as e:
+        if e.error_code == 429 and attempts + 1 < TG_MAX_RETRIES:
+            item[3] += 1
+            log.warning("Telegram 429 for %s, retrying in %ss", chat_id, _retry_after(e))
+            return _retry_after(e)
+        if e.error_code == 403:
+            # Bot was blocked or removed from the chat: drop everything queued for it
+            if unsubscribe(chat_id):
+                log.info("Unsubscribed %s: %s", chat_id, e.description)
+            with _chat_queues_lock:
+                del _chat_queues[chat_id]
+            return None
+        if not _send_failed(item, e):
+            return 0.0
+    except Exception as e:
+        if not _send_failed(item, e):
+            return 0.0
+    with _chat_queues_lock:
+        q = _chat_queues[chat_id]
+        q.popleft()
+        more = bool(q)
+        if not more:
+            del _chat_queues[chat_id]
+    return 0.0 if more else None
+
+
+def _send_failed(item, e):
+    # False: try the call again, without parse_mode; True: give up on it
+    kwargs = item[2]
+    log.error("Telegram send failed (parse_mode=%s): %s", kwargs.get("parse_mode"), e)
+    if kwargs.get("parse_mode"):
+        kwargs["parse_mode"] = None
+        return False
+    return True
+
+
+def _send_worker():
+    while True:
+        chat_id = _send_ready.get()
+        try:
+            delay = _send_next(chat_id)
+        except Exception as e:
+            log.error("Send worker failed for %s: %s", chat_id, e)
+            delay = 1.0
+        if delay is None:
+            continue
+        if delay > 0:
+            _defer(chat_id, delay)
+        else:
+            _send_ready.put(chat_id)
+
+
+def _start_send_workers():
+    threading.Thread(target=_send_timer, name="send-timer", daemon=True).start()
+    for i in range(TG_SEND_WORKERS):
+        threading.Thread(target=_send_worker, name="send-%d" % i, daemon=True).start()
+
+
+def _enqueue(chat_id, chunks, parse_mode):
+    items = [["send_message", (chat_id, chunk),
+              {"parse_mode": parse_mode if parse_mode != "Markdown" or markdown_ok(chunk) else None}, 0]
+             for chunk in chunks]
+    if items:
+        _enqueue_items(chat_id, items)
+
+
+def _enqueue_call(chat_id, call, *args, **kwargs):
+    """Queue call(*args, **kwargs) behind chat_id's pending messages, under the
+    same limits. call gets the chat's token and must use _tg_request."""
+    _enqueue_items(chat_id, [[call, args, kwargs, 0]])
+
+
+def _enqueue_items(chat_id, items):
+    with _chat_queues_lock:
+        q = _chat_queues.get(chat_id)
+        idle = q is None
+        if idle:
+            q = _chat_queues[chat_id] = deque()
+        q.extend(items)
+    if idle:
+        _send_ready.put(chat_id)
 
-# Helpers
 
 def tg_send(chat_id, text, parse_mode="Markdown"):
+    """Queue text for chat_id and return; the send workers deliver it in order."""
     if parse_mode == "Markdown":
         text = sanitize_markdown(text)
-    MAX = 4000
-    chunks = [text[i:i + MAX] for i in range(0, len(text), MAX)]
-    for chunk in chunks:
-        try:
-            bot.send_message(chat_id, chunk, parse_mode=parse_mode)
-            time.sleep(0.3)
-        except Exception as e:
-            log.error("Telegram send failed (parse_mode=%s): %s", parse_mode, e)
-            if parse_mode:
+    _enqueue(chat_id, split_message(text), parse_mode)
+
+
+def tg_broadcast(chat_ids, text, parse_mode="Markdown"):
+    """Queue the same text for many chats, sanitizing and splitting it only once."""
+    if parse_mode == "Markdown":
+        text = sanitize_markdown(text)
+    chunks = split_message(text)
+    for chat_id in chat_ids:
+        _enqueue(chat_id, chunks, parse_mode)
+
+
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+
+
+class LiveMessage:
+    """A Telegram message that is edited in place while its text streams in.
+
+    update() pushes partial text at most every STREAM_EDIT_INTERVAL seconds,
+    without parse_mode since half-written Markdown is rejected. It runs inside
+    the Groq stream, so it never waits on the rate limits: an edit with no
+    token free is skipped. finish() queues the final text, with Markdown,
+    behind the chat's other messages -- spilling past 4000 chars into new
+    ones -- so a build never waits on one chat's rate limit either."""
+
+    def __init__(self, chat_id, header):
+        self.chat_id = chat_id
+        self.header = header
+        self.message_id = None
+        self._shown = None   # (body, parse_mode) on screen now
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def _push(self, body, parse_mode=None, queued=False):
+        # queued: running on a send worker, which has taken the tokens already
+        def call(fn, *args, **kwargs):
+            return _tg_request(fn, *args, **kwargs) if queued else tg_call(self.chat_id, fn, *args, **kwargs)
+        if self.message_id is None:
+            sent = call(bot.send_message, self.chat_id, body, parse_mode=parse_mode)
+            if sent is None:
+                return
+            self.message_id = sent.message_id
+        elif (body, parse_mode) != self._shown:   # same text sent plain still needs its Markdown edit
+            if call(bot.edit_message_text, body, self.chat_id, self.message_id, parse_mode=parse_mode) is None:
+                return
+        self._shown = (body, parse_mode)
+
+    def update(self, text):
+        with self._lock:
+            if time.time() - self._last < STREAM_EDIT_INTERVAL:
+                return
+            self._last = time.time()
+            try:
+                self._push((self.header + "\n" + text)[:4000])
+            except Exception as e:
+                log.warning("Live message update failed: %s", e)
+
+    def finish(self, text):
+        chunks = split_message(sanitize_markdown(self.header + "\n" + text))
+        _enqueue_call(self.chat_id, self._final, chunks[0])
+        if len(chunks) > 1:
+            tg_send(self.chat_id, "\n".join(chunks[1:]))
+
+    def _final(self, first):
+        with self._lock:
+            try:
+                self._push(first, parse_mode="Markdown" if markdown_ok(first) else None, queued=True)
+            except Exception as e:
+                if isinstance(e, telebot.apihelper.ApiTelegramException) and e.error_code in (403, 429):
+                    raise   # the send worker retries 429s and drops blocked chats
+                log.warning("Live message Markdown edit failed, sending plain: %s", e)
                 try:
-                    bot.send_message(chat_id, chunk, parse_mode="")
-                    log.info("Retried without parse_mode OK")
-                    time.sleep(0.3)
+                    self._push(first, queued=True)
                 except Exception as e2:
-                    log.error("Telegram send failed (no parse_mode): %s", e2)
+                    log.error("Live message final edit failed: %s", e2)
+
+
+def _load_feed_cache():
+    try:
+        rows = _db().execute("SELECT url, etag, modified, entries FROM feed_cache ORDER BY ts DESC LIMIT ?",
+                             (FEED_CACHE_MAX,)).fetchall()
+        with _feed_cache_lock:
+            for url, etag, modified, entries in reversed(rows):
+                _feed_cache[url] = {"etag": etag, "modified": modified, "entries": json.loads(entries)}
+        log.info("Feed cache loaded: %d feeds", len(rows))
+    except Exception as e:
+        log.warning("Feed cache load failed: %s", e)
+
+
+def _slim_entry(entry):
+    # Only what the brief uses; struct_time becomes a plain list so it round-trips through JSON
+    pub = entry.get("published_parsed")
+    return {
+        "title": entry.get("title", ""),
+        "link": entry.get("link", ""),
+        "id": entry.get("id", ""),
+        "published_parsed": list(pub[:6]) if pub else None,
+    }
+
+
+def _plain(text):
+    # Titles may carry escaped HTML (Atom type="html", CDATA): keep the text only
+    text = (text or "").strip()
+    if "<" in text or "&" in text:
+        text = html.unescape(re.sub(r"<[^>]+>", "", text)).strip()
+    return " ".join(text.split())
+
+
+def _feed_date(text):
+    """RFC 822 (RSS) or ISO 8601 (Atom, dc:date) -> UTC [y, m, d, H, M, S], or None."""
+    text = (text or "").strip()
+    if not text:
+        return None
+    try:
+        if re.match(r"\d{4}-", text):
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        else:
+            dt = parsedate_to_datetime(text)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return list(dt.astimezone(timezone.utc).timetuple()[:6])
+
+
+class FeedStream:
+    """Incremental RSS / Atom / RDF reader. feed() it chunks of the document;
+    it collects slim entries until it has `limit` of them or FEED_STALE_RUN
+    in a row are older than `horizon` (epoch), then feed() returns True.
+    Malformed XML sets `error` instead of raising."""
+
+    ITEMS = ("item", "entry")
+    DATES = ("pubDate", "published", "date", "updated", "issued", "modified")
+
+    def __init__(self, limit, horizon=None):
+        self.limit = limit
+        self.horizon = horizon
+        self.entries = []
+        self.items = 0      # items seen, kept or not
+        self.done = False
+        self.error = None
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._depth = 0
+        self._item = None   # fields of the item being read
+        self._item_depth = 0
+        self._stale = 0
+
+    def feed(self, chunk):
+        if self.done or self.error:
+            return self.done
+        try:
+            self._parser.feed(chunk)
+            for event, el in self._parser.read_events():
+                if event == "start":
+                    self._start(el)
+                else:
+                    self._end(el)
+                if self.done:
+                    break
+        except ET.ParseError as e:
+            self.error = e
+        return self.done
+
+    def _start(self, el):
+        self._depth += 1
+        if self._item is None and el.tag.rsplit("}", 1)[-1] in self.ITEMS:
+            self._item = {}
+            self._item_depth = self._depth
+            # RDF items carry their URI as rdf:about
+            about = next((v for k, v in el.attrib.items() if k.endswith("about")), None)
+            if about:
+                self._item["id"] = about
+
+    def _end(self, el):
+        depth, self._depth = self._depth, self._depth - 1
+        item = self._item
+        if item is None:
+            return
+        if depth == self._item_depth:
+            self._item = None
+            el.clear()
+            self._close(item)
+            return
+        if depth != self._item_depth + 1:
+            return
+        # Direct children of the item only: <source><title> etc. are ignored
+        name = el.tag.rsplit("}", 1)[-1]
+        if name == "title":
+            item.setdefault("title", _plain("".join(el.itertext())))
+        elif name == "link":
+            # RSS: <link>url</link>; Atom: <link rel="alternate" href="url"/>
+            href = el.get("href")
+            if href is None:
+                item.setdefault("link", (el.text or "").strip())
+            elif el.get("rel", "alternate") == "alternate":
+                item["link"] = href
+            else:
+                item.setdefault("link", href)
+        elif name in ("guid", "id"):
+            item.setdefault("id", (el.text or "").strip())
+        elif name in self.DATES and "published_parsed" not in item:
+            # First date wins; pubDate / published come before updated in practice
+            pub = _feed_date(el.text)
+            if pub:
+                item["published_parsed"] = pub
+
+    def _close(self, item):
+        self.items += 1
+        pub = item.get("published_parsed")
+        if pub and self.horizon and datetime(*pub, tzinfo=timezone.utc).timestamp() < self.horizon:
+            self._stale += 1
+            self.done = self._stale >= FEED_STALE_RUN
+            return
+        self._stale = 0
+        link = item.get("link") or ""
+        if not link and item.get("id", "").startswith("http"):
+            link = item["id"]   # RSS permalink guid standing in for <link>
+        self.entries.append({
+            "title": item.get("title", ""),
+            "link": link,
+            "id": item.get("id", ""),
+            "published_parsed": pub,
+        })
+        self.done = len(self.entries) >= self.limit
+
+
+def _feed_session(url):
+    host = urlparse(url).netloc.lower()
+    with _feed_health_lock:
+        session = _feed_sessions.get(host)
+        if session is None:
+            session = _feed_sessions[host] = requests.Session()
+            session.headers["User-Agent"] = FEED_USER_AGENT
+            session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=FEED_PER_HOST))
+            session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=FEED_PER_HOST))
+    return session
+
+
+_fetch_watch = {}   # { id: (deadline, socket) } for fetch_url bodies being read
+_fetch_watch_lock = threading.Lock()
+_fetch_watchdog_started = False
+
+
+def _fetch_watchdog():
+    # The read timeout only bounds each recv, so a server trickling bytes could
+    # hold a fetch indefinitely; past its deadline the socket is shut down,
+    # which fails the blocked read at once
+    while True:
+        time.sleep(FEED_WATCH_TICK)
+        now = time.monotonic()
+        # Under the lock, so fetch_url can't close the socket in between
+        with _fetch_watch_lock:
+            for key in [key for key, (deadline, _) in _fetch_watch.items() if now > deadline]:
+                try:
+                    _fetch_watch.pop(key)[1].shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def _watch_fetch(key, deadline, sock):
+    global _fetch_watchdog_started
+    with _fetch_watch_lock:
+        _fetch_watch[key] = (deadline, sock)
+        if not _fetch_watchdog_started:
+            _fetch_watchdog_started = True
+            threading.Thread(target=_fetch_watchdog, name="fetch-watchdog", daemon=True).start()
+
+
+def fetch_url(url, headers=None, sink=None):
+    """GET url through its host's session. Returns (status, headers, body);
+    raises on errors, on taking longer than the connect + read timeouts in
+    total, or on a body over FEED_MAX_BYTES. sink(chunk) sees the body as it
+    arrives; once it returns True the rest is not read, and body is what was."""
+    limit = FEED_CONNECT_TIMEOUT + FEED_READ_TIMEOUT
+    deadline = time.monotonic() + limit
+    with _feed_session(url).get(url, headers=headers, stream=True,
+                                timeout=(FEED_CONNECT_TIMEOUT, FEED_READ_TIMEOUT)) as resp:
+        if resp.status_code == 304:
+            return 304, resp.headers, b""
+        resp.raise_for_status()
+        if int(resp.headers.get("Content-Length") or 0) > FEED_MAX_BYTES:
+            raise ValueError("response larger than %d bytes" % FEED_MAX_BYTES)
+        # A dup of the connection's fd: shutting it down fails the read on the original
+        try:
+            sock = socket.fromfd(resp.raw.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+        except (OSError, ValueError):
+            sock = None
+        key = object()
+        if sock is not None:
+            _watch_fetch(key, deadline, sock)
+        body, size = [], 0
+        try:
+            for chunk in resp.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > FEED_MAX_BYTES:
+                    raise ValueError("response larger than %d bytes" % FEED_MAX_BYTES)
+                if time.monotonic() > deadline:
+                    raise TimeoutError("response took over %.0fs" % limit)
+                body.append(chunk)
+                if sink is not None and sink(chunk):
+                    break
+        except requests.RequestException:
+            if time.monotonic() > deadline:
+                raise TimeoutError("response took over %.0fs" % limit)
+            raise
+        finally:
+            if sock is not None:
+                with _fetch_watch_lock:
+                    _fetch_watch.pop(key, None)
+                    sock.close()
+        return resp.status_code, resp.headers, b"".join(body)
+
+
+def feed_allowed(url):
+    """False while url's breaker is open. Once the cool-down is over one
+    caller gets through as a probe; the rest keep skipping until it reports."""
+    now = time.time()
+    with _feed_health_lock:
+        h = _feed_health.get(url)
+        if h is None or h["streak"] < FEED_BREAKER_FAILURES:
+            return True
+        if now < h["open_until"]:
+            return False
+        h["open_until"] = now + FEED_CONNECT_TIMEOUT + FEED_READ_TIMEOUT
+        return True
+
+
+def _feed_outcome(url, seconds, error=None, nbytes=0):
+    with _feed_health_lock:
+        h = _feed_health.get(url)
+        if h is None:
+            h = _feed_health[url] = {"ok": 0, "failed": 0, "slow": 0, "streak": 0, "open_until": 0.0,
+                                     "last_error": None, "last_seconds": None, "bytes": 0}
+        h["last_seconds"] = round(seconds, 3)
+        h["bytes"] += nbytes
+        if error is None and seconds <= FEED_SLOW_SECONDS:
+            h["ok"] += 1
+            h["streak"] = 0
+            return
+        if error is None:
+            h["slow"] += 1
+            h["last_error"] = "slow (%.1fs)" % seconds
+        else:
+            h["failed"] += 1
+            h["last_error"] = str(error)[:200]
+        h["streak"] += 1
+        if h["streak"] < FEED_BREAKER_FAILURES:
+            return
+        h["open_until"] = time.time() + FEED_BREAKER_COOLDOWN
+        reason = h["last_error"]
+    inc("feed_breaker_trips_total", feed=url)
+    log.warning("Feed breaker open for %ds [%s]: %s", FEED_BREAKER_COOLDOWN, url, reason)
+
+
+def feed_health():
+    """{ url: health dict } copy, for /stats."""
+    with _feed_health_lock:
+        return {url: dict(h) for url, h in _feed_health.items()}
 
 
 def safe_parse_feed(url, max_entries=12):
+    with timed("feed_fetch_seconds", feed=url):
+        return _parse_feed(url, max_entries)
+
+
+def _parse_feed(url, max_entries):
+    if not feed_allowed(url):
+        inc("feed_skipped_total", feed=url)
+        return []
+    with _feed_cache_lock:
+        cached = _feed_cache.get(url)
+        if cached:
+            _feed_cache.move_to_end(url)
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("modified"):
+        headers["If-Modified-Since"] = cached["modified"]
+    t0 = time.monotonic()
+    stream = FeedStream(max_entries, time.time() - FEED_HORIZON_HOURS * 3600)
     try:
-        feed = feedparser.parse(url)
-        return feed.entries[:max_entries]
+        status, resp_headers, body = fetch_url(url, headers, sink=stream.feed)
+        if status == 304 and cached:
+            _feed_outcome(url, time.monotonic() - t0)
+            inc("feed_cache_hits_total", feed=url)
+            state_write("UPDATE feed_cache SET ts = ? WHERE url = ?", [(time.time(), url)])
+            return cached["entries"][:max_entries]
+        if stream.done:
+            inc("feed_early_stops_total", feed=url)
+        if stream.error or not stream.items:
+            # Not well-formed XML (stray HTML entities, ...) or not a feed we
+            # know: the whole body was read, let feedparser make sense of it
+            import feedparser
+            inc("feed_fallbacks_total", feed=url)
+            feed = feedparser.parse(body, response_headers={k.lower(): v for k, v in resp_headers.items()})
+            if feed.get("bozo") and not feed.entries:
+                raise ValueError("unparseable feed: %s" % feed.get("bozo_exception"))
+            entries = [_slim_entry(e) for e in feed.entries[:max_entries]]
+        else:
+            entries = stream.entries
     except Exception as e:
+        _feed_outcome(url, time.monotonic() - t0, error=e)
+        inc("feed_errors_total", feed=url)
         log.warning("Feed failed [%s]: %s", url, e)
         return []
+    _feed_outcome(url, time.monotonic() - t0, nbytes=len(body))
+    inc("feed_bytes_total", len(body), feed=url)
+    etag, modified = resp_headers.get("ETag"), resp_headers.get("Last-Modified")
+    # Only feeds with a validator are worth keeping: without one there is no 304
+    with _feed_cache_lock:
+        if etag or modified:
+            _feed_cache[url] = {"etag": etag, "modified": modified, "entries": entries}
+            _feed_cache.move_to_end(url)
+            while len(_feed_cache) > FEED_CACHE_MAX:
+                _feed_cache.popitem(last=False)
+        else:
+            _feed_cache.pop(url, None)
+    if etag or modified:
+        state_write("INSERT OR REPLACE INTO feed_cache (url, etag, modified, entries, ts) VALUES (?, ?, ?, ?, ?)",
+                    [(url, etag, modified, json.dumps(entries), time.time())])
+    elif cached:
+        state_write("DELETE FROM feed_cache WHERE url = ?", [(url,)])
+    return entries[:max_entries]
+
+
+def _submit_feed(url, max_entries):
+    """Fetch url on _feed_pool once its host has a free slot. Returns a Future;
+    cancelling it drops the fetch if it hasn't started yet."""
+    host = urlparse(url).netloc.lower()
+    fut = Future()
+    with _host_lock:
+        if _host_active.get(host, 0) >= FEED_PER_HOST:
+            _host_pending.setdefault(host, deque()).append((fut, url, max_entries))
+            return fut
+        _host_active[host] = _host_active.get(host, 0) + 1
+    _feed_pool.submit(_run_feed, host, fut, url, max_entries)
+    return fut
+
+
+def _run_feed(host, fut, url, max_entries):
+    while True:
+        if fut.set_running_or_notify_cancel():
+            try:
+                fut.set_result(safe_parse_feed(url, max_entries=max_entries))
+            except Exception as e:
+                fut.set_exception(e)
+        # Hand this thread to the host's next waiting fetch, or free the slot
+        with _host_lock:
+            pending = _host_pending.get(host)
+            if not pending:
+                _host_pending.pop(host, None)
+                _host_active[host] -= 1
+                return
+            fut, url, max_entries = pending.popleft()
+
+
+def _fetch_one(url, max_entries):
+    """Fetch one feed, waiting at most FEED_DEADLINE for it. A fetch that times
+    out before it started counts against the feed's breaker; one already
+    running is cut off by fetch_url's watchdog and reports its own failure."""
+    t0 = time.monotonic()
+    fut = _submit_feed(url, max_entries)
+    try:
+        return fut.result(timeout=FEED_DEADLINE)
+    except FuturesTimeout:
+        if fut.cancel():
+            _feed_outcome(url, time.monotonic() - t0, error=TimeoutError("not fetched within %.0fs" % FEED_DEADLINE))
+        inc("feed_deadline_misses_total", feed=url)
+        log.warning("Feed missed %.0fs deadline: %s", FEED_DEADLINE, url)
+        return []
+
+
+def fetch_feeds(urls, max_entries=12, deadline=None):
+    """Fetch many feeds concurrently. Returns { url: entries } for every feed
+    that finished before the deadline; late feeds are logged and left out."""
+    deadline = FEED_DEADLINE if deadline is None else deadline
+    futures = {_submit_feed(url, max_entries): url for url in dict.fromkeys(urls)}
+    with timed("stage_seconds", stage="feeds"):
+        done, late = wait(futures, timeout=deadline)
+    results = {}
+    for fut in done:
+        try:
+            results[futures[fut]] = fut.result()
+        except Exception as e:
+            log.warning("Feed failed [%s]: %s", futures[fut], e)
+    for fut in late:
+        fut.cancel()
+        inc("feed_deadline_misses_total", feed=futures[fut])
+        log.warning("Feed missed %.0fs deadline: %s", deadline, futures[fut])
+    return results
 
 
 def safe_date(entry):
     try:
         if entry.get("published_parsed"):
-            return datetime(*entry.published_parsed[:6], tzinfo=timezone.utc)
+            return datetime(*entry["published_parsed"][:6], tzinfo=timezone.utc)
     except Exception:
         pass
     return None
 
 
+# State store
+# One SQLite connection per thread (WAL lets the readers run alongside the writer).
+# Reads query the tables directly. Writes are queued with state_write() and
+# committed by a single writer thread, one transaction per STATE_FLUSH_SECONDS,
+# so hot paths (a liquidation, a 304, a push id) never wait on the disk;
+# subscriber changes are the exception and commit inline, since the reply
+# reads them back. prune_state() applies STATE_RETENTION.
+
+_db_local = threading.local()
+_state_queue = queue.Queue()   # (sql, rows), or (None, Event) to mark a flush
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, ts REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS sent_headlines (fp TEXT PRIMARY KEY, ts REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS sent_headlines_ts ON sent_headlines (ts)",
+    "CREATE TABLE IF NOT EXISTS subscribers (chat_id TEXT PRIMARY KEY, parts TEXT NOT NULL, created REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS subscriber_times (chat_id TEXT NOT NULL, hhmm TEXT NOT NULL, PRIMARY KEY (chat_id, hhmm))",
+    "CREATE INDEX IF NOT EXISTS subscriber_times_hhmm ON subscriber_times (hhmm)",
+    "CREATE TABLE IF NOT EXISTS push_seen (handle TEXT NOT NULL, entry_id TEXT NOT NULL, ts REAL NOT NULL, "
+    "PRIMARY KEY (handle, entry_id))",
+    "CREATE INDEX IF NOT EXISTS push_seen_ts ON push_seen (handle, ts)",
+    # tid is left untyped so Hyperliquid's integer ids come back as integers
+    "CREATE TABLE IF NOT EXISTS liquidations (tid PRIMARY KEY, ts REAL NOT NULL, coin TEXT NOT NULL, "
+    "notional REAL NOT NULL, is_long INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS liquidations_ts ON liquidations (ts)",
+    "CREATE TABLE IF NOT EXISTS feed_cache (url TEXT PRIMARY KEY, etag TEXT, modified TEXT, entries TEXT NOT NULL, "
+    "ts REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS feed_cache_ts ON feed_cache (ts)",
+    "CREATE TABLE IF NOT EXISTS summary_cache (key TEXT PRIMARY KEY, text TEXT NOT NULL, ts REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS summary_cache_ts ON summary_cache (ts)",
+    # data: the whole snapshot dict as JSON, so briefs keep their parts for render_brief
+    "CREATE TABLE IF NOT EXISTS snapshots (name TEXT PRIMARY KEY, data TEXT NOT NULL, ts REAL NOT NULL)",
+    # ts: the event date (UTC midnight); updated: ACLED's own timestamp, the sync cursor
+    "CREATE TABLE IF NOT EXISTS acled_events (event_id TEXT PRIMARY KEY, ts REAL NOT NULL, updated INTEGER NOT NULL, "
+    "event_type TEXT, sub_event_type TEXT, actor1 TEXT, country TEXT, location TEXT, fatalities INTEGER, notes TEXT)",
+    "CREATE INDEX IF NOT EXISTS acled_events_ts ON acled_events (ts, fatalities)",
+)
+
+# { table: {"age": seconds a row is kept, "keep": newest rows kept, "per": column the cap applies within} }
+STATE_RETENTION = {
+    "sent_headlines": {"age": SENT_RETENTION_HOURS * 3600},
+    "push_seen":      {"age": 30 * 86400, "keep": PUSH_SEEN_MAX, "per": "handle"},
+    "liquidations":   {"age": LIQ_MAX_HOURS * 3600, "keep": LIQ_CAPACITY},
+    "feed_cache":     {"age": 7 * 86400, "keep": FEED_CACHE_MAX},
+    "summary_cache":  {"age": SUMMARY_CACHE_TTL, "keep": SUMMARY_CACHE_MAX},
+    "snapshots":      {"age": 86400},
+    "acled_events":   {"age": ACLED_RETENTION_DAYS * 86400},
+}
+
+
+def _db():
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(STATE_DB, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        _db_local.conn = conn
+    return conn
+
+
+def state_write(sql, rows):
+    """Queue `sql` to be run once per parameter tuple in `rows` by the writer thread."""
+    _state_queue.put((sql, rows))
+
+
+def state_flush(timeout=10):
+    """Wait until every write queued so far is committed. False on timeout."""
+    done = threading.Event()
+    _state_queue.put((None, done))
+    return done.wait(timeout)
+
+
+def _commit_batch(batch):
+    conn = _db()
+    n = 0
+    try:
+        with conn:
+            for sql, rows in batch:
+                conn.executemany(sql, rows)
+                n += len(rows)
+    except Exception as e:
+        inc("state_write_errors_total")
+        log.error("State write of %d statements failed: %s", len(batch), e)
+        return
+    inc("state_rows_written_total", n)
+
+
+def _state_writer():
+    while True:
+        item = _state_queue.get()
+        batch, flushes = [], []
+        deadline = time.monotonic() + STATE_FLUSH_SECONDS
+        while True:
+            if item[0] is None:
+                flushes.append(item[1])
+            else:
+                batch.append(item)
+            if flushes:
+                # Someone is waiting: commit what we have now
+                try:
+                    item = _state_queue.get_nowait()
+                except queue.Empty:
+                    break
+                continue
+            try:
+                item = _state_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+        if batch:
+            with timed("state_commit_seconds"):
+                _commit_batch(batch)
+        for done in flushes:
+            done.set()
+
+
+def _start_state_writer():
+    threading.Thread(target=_state_writer, name="state-writer", daemon=True).start()
+
+
+def prune_state():
+    """Queue the STATE_RETENTION deletes: rows past their age, then rows past the cap."""
+    now = time.time()
+    for table, rule in STATE_RETENTION.items():
+        state_write("DELETE FROM {} WHERE ts < ?".format(table), [(now - rule["age"],)])
+        if rule.get("keep"):
+            partition = "PARTITION BY {} ".format(rule["per"]) if rule.get("per") else ""
+            state_write("DELETE FROM {0} WHERE rowid IN (SELECT rowid FROM (SELECT rowid, ROW_NUMBER() OVER "
+                        "({1}ORDER BY ts DESC) AS n FROM {0}) WHERE n > ?)".format(table, partition),
+                        [(rule["keep"],)])
+
+
+def _import_legacy_files():
+    """Move state older versions kept in files into STATE_DB, once."""
+    path = LEGACY_LAST_BRIEF_FILE
+    if not os.path.exists(path):
+        return
+    try:
+        conn = _db()
+        with conn, open(path, "r") as f:
+            conn.execute("INSERT OR IGNORE INTO kv (key, value, ts) VALUES ('last_brief', ?, ?)",
+                         (f.read().strip(), time.time()))
+        os.replace(path, path + ".migrated")
+        log.info("Imported %s into %s", path, STATE_DB)
+    except Exception as e:
+        log.warning("Import of %s failed: %s", path, e)
+
+
 def get_last_brief_time():
     try:
-        with open(LAST_BRIEF_FILE, "r") as f:
-            dt = datetime.fromisoformat(f.read().strip())
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt
+        row = _db().execute("SELECT value FROM kv WHERE key = 'last_brief'").fetchone()
+        dt = datetime.fromisoformat(row[0])
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt
     except Exception:
         return datetime.now(timezone.utc) - timedelta(days=1)
 
 
 def save_last_brief_time():
-    tmp = LAST_BRIEF_FILE + ".tmp"
-    with open(tmp, "w") as f:
-        f.write(datetime.now(timezone.utc).isoformat())
-    os.replace(tmp, LAST_BRIEF_FILE)
+    state_write("INSERT OR REPLACE INTO kv (key, value, ts) VALUES ('last_brief', ?, ?)",
+                [(datetime.now(timezone.utc).isoformat(), time.time())])
+
+
+def headline_fp(title):
+    norm = " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()[:16]
+
+
+def already_sent(fps):
+    """Return the subset of fingerprints already delivered in a brief."""
+    fps = list(fps)
+    if not fps:
+        return set()
+    try:
+        rows = _db().execute(
+            "SELECT fp FROM sent_headlines WHERE fp IN (" + ",".join("?" * len(fps)) + ")", fps
+        ).fetchall()
+        return {r[0] for r in rows}
+    except Exception as e:
+        log.warning("Sent-headline lookup failed: %s", e)
+        return set()
+
+
+def mark_sent(fps):
+    """Record delivered fingerprints; prune_state() ages them out after SENT_RETENTION_HOURS."""
+    now = time.time()
+    state_write("INSERT OR REPLACE INTO sent_headlines (fp, ts) VALUES (?, ?)", [(fp, now) for fp in set(fps)])
+
+
+# Subscribers
+# Each chat picks which parts of the brief it wants (BRIEF_PARTS) and at which
+# HH:MM times (Europe/Rome) it wants it.
+
+BRIEF_PARTS = ("geo", "market", "tech", "data", "newsletters")
+
+
+def subscribe(chat_id, parts, times):
+    conn = _db()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO subscribers (chat_id, parts, created) VALUES (?, ?, ?)",
+                     (str(chat_id), ",".join(parts), time.time()))
+        conn.execute("DELETE FROM subscriber_times WHERE chat_id = ?", (str(chat_id),))
+        conn.executemany("INSERT INTO subscriber_times (chat_id, hhmm) VALUES (?, ?)",
+                         [(str(chat_id), t) for t in set(times)])
+
+
+def unsubscribe(chat_id):
+    """Remove a subscriber. Returns True if it existed."""
+    conn = _db()
+    with conn:
+        conn.execute("DELETE FROM subscriber_times WHERE chat_id = ?", (str(chat_id),))
+        return conn.execute("DELETE FROM subscribers WHERE chat_id = ?", (str(chat_id),)).rowcount > 0
+
+
+def get_subscription(chat_id):
+    """(parts, times) for a subscribed chat, else None."""
+    conn = _db()
+    row = conn.execute("SELECT parts FROM subscribers WHERE chat_id = ?", (str(chat_id),)).fetchone()
+    if row is None:
+        return None
+    times = [r[0] for r in conn.execute(
+        "SELECT hhmm FROM subscriber_times WHERE chat_id = ? ORDER BY hhmm", (str(chat_id),))]
+    return tuple(row[0].split(",")), times
+
+
+def due_subscribers(hhmm):
+    """[(chat_id, parts)] of everyone who wants a brief at hhmm."""
+    rows = _db().execute(
+        "SELECT s.chat_id, s.parts FROM subscriber_times t JOIN subscribers s ON s.chat_id = t.chat_id "
+        "WHERE t.hhmm = ?", (hhmm,)).fetchall()
+    return [(chat_id, tuple(parts.split(","))) for chat_id, parts in rows]
 
 
 # ACLED integration
+# sync_acled() runs on the scheduler and keeps acled_events current; briefs
+# only ever read that table, so they never wait on ACLED.
+
+_acled_sync_lock = threading.Lock()
+
 
 def _acled_login():
     """Authenticate with ACLED and return a logged-in session, or None on failure."""
@@ -215,7 +1718,7 @@ def _acled_login():
     try:
         s = requests.Session()
         resp = s.post(
-            "https://acleddata.com/user/login?_format=json",
+            ACLED_LOGIN_URL,
             json={"name": ACLED_EMAIL, "pass": ACLED_PASSWORD},
             timeout=10
         )
@@ -231,83 +1734,201 @@ def _acled_login():
         return None
 
 
-def get_acled_news():
-    """Fetch last 24h high-severity conflict events from ACLED API."""
-    global _acled_session
+def _acled_get(params):
+    """GET the ACLED API, logging in first if needed and once more on a 401. Returns the rows."""
+    session = _acled_session or _acled_login()
+    for attempt in range(2):
+        if session is None:
+            raise RuntimeError("not logged in to ACLED")
+        r = session.get(ACLED_API_URL, params=params, timeout=30)
+        if r.status_code == 401 and attempt == 0:
+            log.info("ACLED session expired, re-logging in")
+            session = _acled_login()
+            continue
+        r.raise_for_status()
+        return r.json().get("data", [])
+
+
+def sync_acled():
+    """Pull events added or revised since the stored cursor, page by page, into
+    acled_events. Rows at the cursor itself are read again and upserted, since
+    ACLED stamps a whole upload with one timestamp.
+
+    A pass reads at most ACLED_MAX_PAGES pages. Progress is saved after every
+    page -- the query's cursor and date range, the next page and the newest
+    timestamp seen -- and the next sync resumes that same query where this
+    one stopped (or failed). ACLED doesn't promise any row order, so the
+    cursor only moves to the newest timestamp once the last page is read."""
     if not ACLED_EMAIL or not ACLED_PASSWORD:
-        return []
-    if _acled_session is None:
-        _acled_login()
-    if _acled_session is None:
-        return []
-    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-    today = datetime.now().strftime("%Y-%m-%d")
+        return
+    if not _acled_sync_lock.acquire(blocking=False):
+        return
     try:
-        r = _acled_session.get(
-            "https://acleddata.com/api/acled/read",
-            params={
-                "event_date": yesterday + "|" + today,
-                "event_date_where": "BETWEEN",
-                "event_type": "Battles|Explosions/Remote violence|Violence against civilians",
-                "limit": 20,
-                "fields": "event_date|event_type|sub_event_type|actor1|actor2|country|location|notes",
-            },
-            timeout=15
-        )
-        if r.status_code == 401:
-            log.info("ACLED session expired, re-logging in")
-            _acled_login()
-            return []
-        data = r.json().get("data", [])
-        entries = []
-        for ev in data:
-            country  = ev.get("country", "")
-            location = ev.get("location", "")
-            actor1   = ev.get("actor1", "")
-            etype    = ev.get("sub_event_type", ev.get("event_type", ""))
-            notes    = ev.get("notes", "")[:120]
-            title    = "[ACLED] " + etype + " -- " + location + ", " + country
-            if actor1:
-                title += " (" + actor1 + ")"
-            entries.append({"title": title, "link": "https://acleddata.com/data-export-tool/", "notes": notes})
-        return entries
+        row = _db().execute("SELECT value FROM kv WHERE key = 'acled_cursor'").fetchone()
+        state = json.loads(row[0]) if row else {}
+        if not isinstance(state, dict):
+            state = {"timestamp": state}
+        if not state.get("page"):
+            # Fresh pass from the cursor
+            today = datetime.now(timezone.utc).date()
+            state = {"timestamp": state.get("timestamp", 0), "page": 1, "newest": state.get("timestamp", 0),
+                     "from": (today - timedelta(days=ACLED_LOOKBACK_DAYS)).isoformat(), "to": today.isoformat()}
+        params = {
+            "event_date": state["from"] + "|" + state["to"],
+            "event_date_where": "BETWEEN",
+            "timestamp": state["timestamp"],
+            "timestamp_where": ">=",
+            "event_type": ACLED_EVENT_TYPES,
+            "fields": "event_id_cnty|event_date|timestamp|event_type|sub_event_type|actor1|country|location|fatalities|notes",
+            "limit": ACLED_PAGE_SIZE,
+        }
+        cursor, first_page, total = state["timestamp"], state["page"], 0
+        with timed("acled_sync_seconds"):
+            for page in range(first_page, first_page + ACLED_MAX_PAGES):
+                data = _acled_get(dict(params, page=page))
+                rows = []
+                for ev in data:
+                    try:
+                        day = datetime.fromisoformat(ev["event_date"]).replace(tzinfo=timezone.utc)
+                        updated = int(ev.get("timestamp") or 0)
+                        rows.append((ev["event_id_cnty"], day.timestamp(), updated, ev.get("event_type", ""),
+                                     ev.get("sub_event_type", ""), ev.get("actor1", ""), ev.get("country", ""),
+                                     ev.get("location", ""), int(ev.get("fatalities") or 0), ev.get("notes", "")))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    state["newest"] = max(state["newest"], updated)
+                state_write("INSERT OR REPLACE INTO acled_events (event_id, ts, updated, event_type, sub_event_type, "
+                            "actor1, country, location, fatalities, notes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                total += len(rows)
+                if len(data) < ACLED_PAGE_SIZE:
+                    state = {"timestamp": state["newest"]}
+                    break
+                state["page"] = page + 1
+                state_write("INSERT OR REPLACE INTO kv (key, value, ts) VALUES ('acled_cursor', ?, ?)",
+                            [(json.dumps(state), time.time())])
+            else:
+                log.warning("ACLED sync read %d pages; resuming at page %d next time", ACLED_MAX_PAGES, state["page"])
+        state_write("INSERT OR REPLACE INTO kv (key, value, ts) VALUES ('acled_cursor', ?, ?)",
+                    [(json.dumps(state), time.time())])
+        state_flush()
+        inc("acled_events_total", total)
+        log.info("ACLED sync: %d events from page %d (cursor %d -> %d)", total, first_page, cursor,
+                 state["timestamp"])
     except Exception as e:
-        log.warning("ACLED fetch failed: %s", e)
+        inc("acled_errors_total")
+        log.warning("ACLED sync failed: %s", e)
+    finally:
+        _acled_sync_lock.release()
+
+
+def get_acled_news():
+    """High-severity conflict events dated today or yesterday (UTC), from the
+    local cache: the ACLED_BRIEF_EVENTS with most fatalities, then one line
+    counting the rest per country, so a busy day still shows its scale."""
+    since = datetime.combine(datetime.now(timezone.utc).date() - timedelta(days=1), datetime.min.time(),
+                             tzinfo=timezone.utc).timestamp()
+    try:
+        with timed("stage_seconds", stage="acled"):
+            rows = _db().execute(
+                "SELECT event_type, sub_event_type, actor1, country, location, fatalities, notes FROM acled_events "
+                "WHERE ts >= ? ORDER BY fatalities DESC, ts DESC", (since,)).fetchall()
+    except Exception as e:
+        log.warning("ACLED cache read failed: %s", e)
         return []
+    entries = []
+    for event_type, sub_event_type, actor1, country, location, fatalities, notes in rows[:ACLED_BRIEF_EVENTS]:
+        etype = sub_event_type or event_type or ""
+        title = "[ACLED] " + etype + " -- " + location + ", " + country
+        if actor1:
+            title += " (" + actor1 + ")"
+        entries.append({"title": title, "link": "https://acleddata.com/data-export-tool/", "notes": (notes or "")[:120],
+                        "source": "acleddata.com"})
+    rest = rows[ACLED_BRIEF_EVENTS:]
+    if rest:
+        by_country = {}
+        for row in rest:
+            by_country[row[3]] = by_country.get(row[3], 0) + 1
+        top = sorted(by_country.items(), key=lambda kv: -kv[1])[:5]
+        entries.append({"title": "[ACLED] {} more events: {}".format(
+                            len(rest), ", ".join("{} {}".format(c, n) for c, n in top)),
+                        "link": "https://acleddata.com/data-export-tool/", "source": "acleddata.com"})
+    return entries
 
 
 # SITREP / push-notification poller
 
-def _check_push_accounts():
-    """Poll each push account via RSSHub every 10 min. Send alert for new posts."""
-    for handle, category in PUSH_ACCOUNTS:
+_push_pool = ThreadPoolExecutor(max_workers=PUSH_WORKERS, thread_name_prefix="push")
+
+
+def _load_push_seen(handle):
+    rows = _db().execute("SELECT entry_id FROM push_seen WHERE handle = ? ORDER BY ts DESC LIMIT ?",
+                         (handle, PUSH_SEEN_MAX)).fetchall()
+    return BoundedSet(PUSH_SEEN_MAX, reversed([r[0] for r in rows]))
+
+
+def _store_push_seen(handle, ids):
+    # ids come newest first; the tiny ts offsets keep that order for _load_push_seen
+    now = time.time()
+    state_write("INSERT OR IGNORE INTO push_seen (handle, entry_id, ts) VALUES (?, ?, ?)",
+                [(handle, i, now - n / 1e6) for n, i in enumerate(ids)])
+
+
+def _poll_push_account(handle, category):
+    """Poll one account and alert its new posts, then schedule its next poll."""
+    alerted = 0
+    try:
         url = RSSHUB_URL + "/twitter/user/" + handle + "?exclude_rts=1"
-        try:
-            feed = feedparser.parse(url)
-            if not feed.entries:
-                continue
-            seen = _push_seen.setdefault(handle, set())
-            new_entries = []
-            for entry in feed.entries[:5]:
-                entry_id = entry.get("id") or entry.get("link", "")
-                if entry_id and entry_id not in seen:
-                    new_entries.append(entry)
-                    seen.add(entry_id)
-            # On first run just seed seen IDs, don't spam
-            if len(seen) <= len(new_entries):
-                log.info("Push poller: seeded %d IDs for @%s", len(seen), handle)
+        seen = _push_seen.get(handle)
+        if seen is None:
+            seen = _push_seen[handle] = _load_push_seen(handle)
+        known = len(seen)
+        entries = _fetch_one(url, PUSH_ENTRIES)
+        inc("push_polls_total")
+        new_entries = [e for e in entries if (e.get("id") or e.get("link")) and seen.add(e.get("id") or e.get("link"))]
+        if new_entries:
+            _store_push_seen(handle, [e.get("id") or e.get("link") for e in new_entries])
+        # First time we ever see this account: just seed, don't spam
+        if not known:
+            log.info("Push poller: seeded %d IDs for @%s", len(new_entries), handle)
+            return
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=PUSH_MAX_AGE)
+        for entry in reversed(new_entries):   # feeds list newest first
+            pub = safe_date(entry)
+            if pub and pub < cutoff:
                 continue
-            for entry in new_entries:
-                title = entry.get("title", "").strip()[:300]
-                link  = entry.get("link", "")
-                emoji = "\U0001f6a8" if category == "geo" else "\U0001f4ca"
-                msg   = emoji + " *@" + handle + "*\n" + title
-                if link:
-                    msg += "\n[link](" + link + ")"
-                tg_send(CHANNEL_ID, msg)
-                log.info("Push alert sent for @%s", handle)
-        except Exception as e:
-            log.warning("Push poll failed for @%s: %s", handle, e)
+            title = entry.get("title", "").strip()[:300]
+            link  = entry.get("link", "")
+            emoji = "\U0001f6a8" if category == "geo" else "\U0001f4ca"
+            msg   = emoji + " *@" + handle + "*\n" + title
+            if link:
+                msg += "\n[link](" + link + ")"
+            tg_send(CHANNEL_ID, msg)
+            alerted += 1
+            inc("push_alerts_total")
+            log.info("Push alert sent for @%s", handle)
+    except Exception as e:
+        log.warning("Push poll failed for @%s: %s", handle, e)
+    finally:
+        with _push_lock:
+            state = _push_state[handle]
+            state["interval"] = PUSH_MIN_INTERVAL if alerted else min(PUSH_MAX_INTERVAL, state["interval"] * PUSH_BACKOFF)
+            # Jitter keeps accounts from polling in lockstep
+            state["due"] = time.time() + state["interval"] * random.uniform(0.9, 1.1)
+            state["busy"] = False
+
+
+def _check_push_accounts():
+    """Runs every PUSH_TICK seconds: start a poll for every account that is due."""
+    now = time.time()
+    due = []
+    with _push_lock:
+        for handle, category in PUSH_ACCOUNTS:
+            state = _push_state.setdefault(handle, {"interval": PUSH_MIN_INTERVAL, "due": 0.0, "busy": False})
+            if not state["busy"] and state["due"] <= now:
+                state["busy"] = True
+                due.append((handle, category))
+    for handle, category in due:
+        _push_pool.submit(_poll_push_account, handle, category)
 
 
 def sanitize_markdown(text):
@@ -337,31 +1958,219 @@ def sanitize_markdown(text):
 
 # Deduplication
 # Removes articles whose titles are too similar to ones already seen.
-# Uses a simple ratio threshold so near-duplicate stories from different
-# sources are collapsed into one.
+# Titles are shingled into character 3-grams and MinHashed; locality-sensitive
+# hashing over bands of the signature finds the few earlier titles that could
+# be near-duplicates, and only those get the exact SequenceMatcher ratio check.
+# Each lookup is near-constant time instead of a scan of every kept title.
+
+DEDUP_SHINGLE = 3
+DEDUP_BANDS   = 20   # 20 bands x 3 rows: candidates from ~0.37 shingle Jaccard up
+DEDUP_ROWS    = 3
+
+
+def _shingles(text):
+    text = " ".join(text.split())
+    if len(text) <= DEDUP_SHINGLE:
+        return {text}
+    return {text[i:i + DEDUP_SHINGLE] for i in range(len(text) - DEDUP_SHINGLE + 1)}
+
+
+def _minhash(shingles, slots):
+    # One-permutation hashing: each shingle is hashed once and binned by h % slots,
+    # empty bins borrow from the next filled bin so short titles still compare.
+    sig = [-1] * slots
+    for sh in shingles:
+        h = zlib.crc32(sh.encode("utf-8"))
+        b, v = h % slots, h // slots
+        if sig[b] < 0 or v < sig[b]:
+            sig[b] = v
+    if -1 in sig:
+        filled = [i for i, v in enumerate(sig) if v >= 0]
+        for i in range(slots):
+            if sig[i] < 0:
+                j = next((f for f in filled if f > i), filled[0])
+                sig[i] = sig[j] + ((j - i) % slots) * 0x100000000
+    return sig
+
+
+class NearDupIndex:
+    """Incremental near-duplicate index over headline titles.
+
+    match() returns the position of an indexed title whose SequenceMatcher
+    ratio exceeds `threshold`, or None; add() indexes a title and returns its
+    position."""
+
+    def __init__(self, threshold=0.82, bands=DEDUP_BANDS, rows=DEDUP_ROWS):
+        self.threshold = threshold
+        self.bands, self.rows = bands, rows
+        self._buckets = [{} for _ in range(bands)]
+        self._titles = []
+
+    def __len__(self):
+        return len(self._titles)
+
+    def _keys(self, title):
+        sig = _minhash(_shingles(title), self.bands * self.rows)
+        r = self.rows
+        return [tuple(sig[b * r:(b + 1) * r]) for b in range(self.bands)]
+
+    def match(self, title, keys=None):
+        title = title.lower()
+        keys = keys or self._keys(title)
+        checked = set()
+        for bucket, key in zip(self._buckets, keys):
+            for pos in bucket.get(key, ()):
+                if pos in checked:
+                    continue
+                checked.add(pos)
+                sm = SequenceMatcher(None, title, self._titles[pos])
+                if (sm.real_quick_ratio() > self.threshold
+                        and sm.quick_ratio() > self.threshold
+                        and sm.ratio() > self.threshold):
+                    return pos
+        return None
 
-def deduplicate(articles, threshold=0.82):
-    seen_titles = []
+    def add(self, title, keys=None):
+        title = title.lower()
+        keys = keys or self._keys(title)
+        pos = len(self._titles)
+        self._titles.append(title)
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(pos)
+        return pos
+
+
+def deduplicate(articles, threshold=0.82, index=None):
+    # Pass a NearDupIndex to dedupe incrementally across calls. Each kept item's
+    # "seen" counts the articles (itself included) that collapsed into it.
+    if index is None:
+        index = NearDupIndex(threshold)
     unique = []
+    kept = {}   # index position -> kept item
     for item in articles:
         title = item.get("title", "")
-        is_dupe = any(
-            SequenceMatcher(None, title.lower(), seen.lower()).ratio() > threshold
-            for seen in seen_titles
-        )
-        if not is_dupe:
-            seen_titles.append(title)
+        keys = index._keys(title.lower())
+        pos = index.match(title, keys)
+        if pos is None:
+            item["seen"] = 1
+            kept[index.add(title, keys)] = item
             unique.append(item)
+        elif pos in kept:
+            kept[pos]["seen"] += 1
     return unique
 
 
+# Ranking and prompt packing
+# Headlines are scored locally so the prompt carries the best ones first and
+# only as many as fit the section's token budget:
+#   score = source priority * recency decay * corroboration boost + keyword weight
+# Sources are feed hosts, or "@handle" for twitter feeds served through RSSHub.
+
+SOURCE_PRIORITY = {
+    "a16zcrypto.com":  3.0,
+    "reuters.com":     1.5,
+    "bloomberg.com":   1.5,
+    "ft.com":          1.4,
+    "@DeItaone":       1.4,
+    "bbci.co.uk":      1.3,
+    "acleddata.com":   1.2,
+    "news.google.com": 0.8,
+}
+KEYWORD_WEIGHTS = {
+    "breaking": 0.5, "missile": 0.4, "invasion": 0.4, "ceasefire": 0.3, "sanction": 0.3,
+    "fed": 0.4, "rate cut": 0.4, "rate hike": 0.4, "cpi": 0.3, "inflation": 0.3, "earnings": 0.2,
+    "etf": 0.2, "openai": 0.3, "anthropic": 0.3, "nvidia": 0.3, "model": 0.1,
+}
+# Whole words only ("fed" is not in "Federal", "etf" not in "Netflix"), plurals included
+_KEYWORD_RES = [(re.compile(r"\b%ss?\b" % re.escape(kw), re.I), w) for kw, w in KEYWORD_WEIGHTS.items()]
+RANK_HALF_LIFE = 6   # hours
+SECTION_INPUT_TOKENS = {"geo": 1800, "market": 1400, "tech": 1400}
+
+
+def estimate_tokens(text):
+    """Rough Llama-3 token count: ~4 letters per token for words, ~3 digits per token
+    for numbers, and one token per punctuation mark (URLs are mostly punctuation)."""
+    n = 0
+    for piece in re.findall(r"[^\W\d_]+|\d+|[^\w\s]|_", text):
+        if piece[0].isdigit():
+            n += (len(piece) + 2) // 3
+        elif piece[0].isalpha():
+            n += (len(piece) + 3) // 4
+        else:
+            n += 1
+    return n
+
+
+def _source_of(feed_url):
+    if feed_url.startswith(RSSHUB_URL) and "/twitter/user/" in feed_url:
+        return "@" + feed_url.split("/twitter/user/")[1].split("?")[0]
+    host = urlparse(feed_url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _source_priority(source):
+    for key, weight in SOURCE_PRIORITY.items():
+        if source == key or source.endswith("." + key):
+            return weight
+    return 1.0
+
+
+def rank_entries(entries, now=None):
+    """Sort entries best-first. Uses "source", "pub" and "seen" when present."""
+    now = now or datetime.now(timezone.utc)
+
+    def score(e):
+        pub = e.get("pub")
+        recency = 0.5 ** ((now - pub).total_seconds() / 3600 / RANK_HALF_LIFE) if pub else 0.5
+        corroboration = 1 + 0.5 * (e.get("seen", 1) - 1)
+        keywords = sum(w for rx, w in _KEYWORD_RES if rx.search(e["title"]))
+        return _source_priority(e.get("source", "")) * recency * corroboration + keywords
+
+    return sorted(entries, key=score, reverse=True)
+
+
+def pack_entries(entries, budget):
+    """Take entries in order while their formatted lines fit in `budget` tokens."""
+    packed, used = [], 0
+    for e in entries:
+        cost = estimate_tokens(_format_entries([e])) + 1
+        if used + cost > budget:
+            continue
+        packed.append(e)
+        used += cost
+    return packed
+
+
+def pack_lines(text, budget):
+    """Token-bounded cut of already-ranked headline text, on line boundaries."""
+    out, used = [], 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        out.append(line)
+        used += cost
+    return "\n".join(out)
+
+
 # News fetchers (RSS only - newsletters never included here)
 
-def _fetch_entries(feeds, max_per_feed=10, total=35, hours=12):
-    cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
+def _fetch_entries(feeds, max_per_feed=10, total=35, hours=12, only_new=False, sent=None,
+                   budget=None, extra=()):
+    # only_new: drop headlines a previous brief already delivered and reach back
+    # to the last brief if that is further than `hours`. `sent` collects the
+    # fingerprints of what is returned so the caller can mark them once delivered.
+    # Entries are ranked, then packed into `budget` tokens; `extra` entries
+    # (e.g. ACLED events) compete in the same ranking.
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(hours=hours)
+    if only_new:
+        cutoff = min(cutoff, max(get_last_brief_time(), now - timedelta(hours=24)))
     raw = []
+    fetched = fetch_feeds(feeds, max_entries=max_per_feed)
     for url in feeds:
-        for entry in safe_parse_feed(url, max_entries=max_per_feed):
+        source = _source_of(url)
+        for entry in fetched.get(url, []):
             title = entry.get("title", "").strip()
             link = entry.get("link", "")
             if not title or not link:
@@ -370,9 +2179,20 @@ def _fetch_entries(feeds, max_per_feed=10, total=35, hours=12):
             # If feed has no date info, include it anyway (better than missing news)
             if pub and pub < cutoff:
                 continue
-            raw.append({"title": title[:160], "link": link})
-    deduped = deduplicate(raw)
-    return deduped[:total]
+            raw.append({"title": title[:160], "link": link, "fp": headline_fp(title),
+                        "pub": pub, "source": source})
+    if only_new:
+        done = already_sent(e["fp"] for e in raw)
+        raw = [e for e in raw if e["fp"] not in done]
+    with timed("stage_seconds", stage="dedup"):
+        unique = deduplicate(raw)
+    with timed("stage_seconds", stage="rank"):
+        ranked = rank_entries(unique + list(extra), now)[:total]
+        if budget:
+            ranked = pack_entries(ranked, budget)
+    if sent is not None:
+        sent.extend(e["fp"] for e in ranked if e.get("fp"))
+    return ranked
 
 
 def _format_entries(entries):
@@ -384,29 +2204,31 @@ def _format_entries(entries):
     return "\n".join(lines)
 
 
-def get_osint_news():
-    entries = _fetch_entries(OSINT_FEEDS, max_per_feed=8, total=35)
-    # Append ACLED conflict events
-    acled = get_acled_news()
-    entries = entries + acled
-    return _format_entries(entries[:40]) or "- No major updates"
+def get_osint_news(only_new=False, sent=None):
+    # ACLED conflict events are ranked alongside the RSS headlines
+    entries = _fetch_entries(OSINT_FEEDS, max_per_feed=8, total=40, only_new=only_new, sent=sent,
+                             budget=SECTION_INPUT_TOKENS["geo"], extra=get_acled_news())
+    return _format_entries(entries) or "- No major updates"
 
 
-def get_market_news():
-    entries = _fetch_entries(MARKET_FEEDS, max_per_feed=10, total=20)
+def get_market_news(only_new=False, sent=None):
+    entries = _fetch_entries(MARKET_FEEDS, max_per_feed=10, total=20, only_new=only_new, sent=sent,
+                             budget=SECTION_INPUT_TOKENS["market"])
     return _format_entries(entries) or "- No market news"
 
 
-def get_tech_news():
-    entries = _fetch_entries(TECH_FEEDS, max_per_feed=10, total=20)
+def get_tech_news(only_new=False, sent=None):
+    entries = _fetch_entries(TECH_FEEDS, max_per_feed=10, total=20, only_new=only_new, sent=sent,
+                             budget=SECTION_INPUT_TOKENS["tech"])
     return _format_entries(entries) or "- No tech news"
 
 
 def get_newsletters_raw():
     cutoff = datetime.now(timezone.utc) - timedelta(hours=12)
     lines = []
+    fetched = fetch_feeds([url for _, url in NEWSLETTER_FEEDS], max_entries=5)
     for name, url in NEWSLETTER_FEEDS:
-        for entry in safe_parse_feed(url, max_entries=5):
+        for entry in fetched.get(url, []):
             pub = safe_date(entry)
             if pub and pub > cutoff:
                 title = entry.get("title", "Untitled").strip()
@@ -417,32 +2239,69 @@ def get_newsletters_raw():
 
 # Market data (fetched directly, never passed through Groq)
 
-def fetch_ticker(symbol):
-    try:
-        data = yf.Ticker(symbol).history(period="2d")["Close"]
-        if len(data) < 2:
-            return symbol, None, None
-        change = ((data.iloc[-1] - data.iloc[-2]) / data.iloc[-2]) * 100
-        return symbol, data.iloc[-1], change
-    except Exception as e:
-        log.warning("yfinance failed [%s]: %s", symbol, e)
-        return symbol, None, None
-
-
-def get_market_update():
-    tickers = {
-        "^GSPC":   "S&P 500",
-        "^IXIC":   "Nasdaq",
-        "^DJI":    "Dow",
-        "NVDA":    "NVDA",
-        "TSLA":    "TSLA",
-        "AAPL":    "AAPL",
-        "BTC-USD": "BTC",
-        "ETH-USD": "ETH",
-    }
+MARKET_TICKERS = {
+    "^GSPC":   "S&P 500",
+    "^IXIC":   "Nasdaq",
+    "^DJI":    "Dow",
+    "NVDA":    "NVDA",
+    "TSLA":    "TSLA",
+    "AAPL":    "AAPL",
+    "BTC-USD": "BTC",
+    "ETH-USD": "ETH",
+}
+
+COMMODITY_TICKERS = {
+    "GC=F": "Gold",
+    "CL=F": "Crude Oil",
+    "NG=F": "Nat Gas",
+    "^VIX": "VIX",
+}
+
+# Quotes for every ticker come from one batched yfinance download and are
+# shared by all commands for QUOTE_TTL seconds
+QUOTE_TTL = int(os.getenv("QUOTE_TTL", "120"))
+_quotes = {}        # { symbol: (price, change_pct) }
+_quotes_at = 0.0
+_quotes_lock = threading.Lock()
+
+
+def _download_quotes(symbols):
+    import yfinance as yf
+    frame = yf.download(symbols, period="5d", interval="1d", auto_adjust=True,
+                        progress=False, threads=True)
+    close = frame["Close"].reindex(columns=symbols)
+    # Last two valid closes per symbol -- crypto trades on days the indices don't,
+    # so the rows of the combined frame are not aligned per symbol
+    last2 = close.apply(lambda col: col.dropna().iloc[-2:].reset_index(drop=True)).reindex([0, 1])
+    price = last2.iloc[1]
+    change = (price - last2.iloc[0]) / last2.iloc[0] * 100
+    quotes = {}
+    for symbol in symbols:
+        p, c = price.get(symbol), change.get(symbol)
+        quotes[symbol] = (None, None) if p != p or c != c or p is None else (float(p), float(c))
+    return quotes
+
+
+def get_quotes():
+    """Return { symbol: (price, change_pct) } for all tickers, refreshed at most every QUOTE_TTL."""
+    global _quotes, _quotes_at
+    with _quotes_lock:
+        if time.time() - _quotes_at > QUOTE_TTL:
+            symbols = list(MARKET_TICKERS) + list(COMMODITY_TICKERS)
+            try:
+                with timed("stage_seconds", stage="quotes"):
+                    _quotes = _download_quotes(symbols)
+                _quotes_at = time.time()
+            except Exception as e:
+                log.warning("yfinance batch download failed: %s", e)
+        return dict(_quotes)
+
+
+def _format_quotes(tickers):
+    quotes = get_quotes()
     lines = []
     for symbol, label in tickers.items():
-        _, price, change = fetch_ticker(symbol)
+        price, change = quotes.get(symbol, (None, None))
         if price is not None:
             emoji = "\U0001f7e2" if change > 0 else "\U0001f534"
             sign = "+" if change > 0 else ""
@@ -452,28 +2311,21 @@ def get_market_update():
     return "\n".join(lines)
 
 
+def get_market_update():
+    return _format_quotes(MARKET_TICKERS)
+
+
 def get_commodities_vol():
-    tickers = {
-        "GC=F": "Gold",
-        "CL=F": "Crude Oil",
-        "NG=F": "Nat Gas",
-        "^VIX": "VIX",
-    }
-    lines = []
-    for symbol, label in tickers.items():
-        _, price, change = fetch_ticker(symbol)
-        if price is not None:
-            emoji = "\U0001f7e2" if change > 0 else "\U0001f534"
-            sign = "+" if change > 0 else ""
-            lines.append("- " + label + ": " + "{:.2f}".format(price) + " (" + sign + "{:.1f}".format(change) + "%) " + emoji)
-        else:
-            lines.append("- " + label + ": N/A")
-    return "\n".join(lines)
+    return _format_quotes(COMMODITY_TICKERS)
+
+
+FEAR_GREED_URL = os.getenv("FEAR_GREED_URL", "https://api.alternative.me/fng/")
+FINNHUB_URL    = os.getenv("FINNHUB_URL", "https://finnhub.io/api/v1")
 
 
 def get_fear_greed():
     try:
-        d = requests.get("https://api.alternative.me/fng/", timeout=8).json()["data"][0]
+        d = requests.get(FEAR_GREED_URL, timeout=8).json()["data"][0]
         return d["value_classification"] + " (" + d["value"] + ")"
     except Exception as e:
         log.warning("Fear & Greed failed: %s", e)
@@ -484,7 +2336,7 @@ def get_economic_calendar():
     today = datetime.now().strftime("%Y-%m-%d")
     try:
         url = (
-            "https://finnhub.io/api/v1/calendar/economic?from="
+            FINNHUB_URL + "/calendar/economic?from="
             + today + "&to=" + today
             + "&token=" + os.getenv("FINNHUB_KEY", "")
         )
@@ -510,32 +2362,13 @@ def _fmt_usd(n):
 
 def get_hyperliquid_snapshot(hours=12):
     """Aggregate liquidations over the last `hours` hours into a digest."""
-    cutoff = time.time() - hours * 3600
-    with liq_lock:
-        recent = [l for l in liq_cache if l.get("ts", 0) >= cutoff]
-
-    if not recent:
+    agg = liq_store.window(hours)
+    if not agg:
         return "Quiet -- no significant liquidations in last {}h".format(hours)
 
-    # Aggregate per coin: total long liq USD, total short liq USD, counts
-    from collections import defaultdict
-    agg = defaultdict(lambda: {"long_usd": 0.0, "short_usd": 0.0, "long_n": 0, "short_n": 0, "total_usd": 0.0})
-    total_liq_usd = 0.0
-
-    for l in recent:
-        coin = l.get("coin", "?")
-        sz = float(l.get("sz", 0))
-        px = float(l.get("px", 0))
-        ntl = sz * px
-        is_long = "Long" in l.get("dir", "")
-        if is_long:
-            agg[coin]["long_usd"] += ntl
-            agg[coin]["long_n"] += 1
-        else:
-            agg[coin]["short_usd"] += ntl
-            agg[coin]["short_n"] += 1
-        agg[coin]["total_usd"] += ntl
-        total_liq_usd += ntl
+    for data in agg.values():
+        data["total_usd"] = data["long_usd"] + data["short_usd"]
+    total_liq_usd = sum(d["total_usd"] for d in agg.values())
 
     # Sort by total USD liquidated
     sorted_coins = sorted(agg.items(), key=lambda x: x[1]["total_usd"], reverse=True)
@@ -561,11 +2394,80 @@ def get_hyperliquid_snapshot(hours=12):
     return "\n".join(lines)
 
 
+# Summary cache
+# Groq output keyed on a hash of model, mode and the normalized headline text,
+# so an unchanged set of headlines is only summarized once. LRU with a TTL,
+# kept in the summary_cache table next to the feed cache.
+
+_summary_cache = OrderedDict()   # { key: {"text": str, "ts": epoch} }
+_summary_cache_lock = threading.Lock()
+summary_cache_stats = {"hits": 0, "misses": 0, "expired": 0}
+
+
+def _summary_key(raw_data, mode):
+    # Order and spacing of headlines don't change what Groq is asked to summarize
+    lines = sorted(" ".join(line.split()) for line in raw_data.splitlines() if line.strip())
+    payload = GROQ_MODEL + "\n" + mode + "\n" + "\n".join(lines)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _load_summary_cache():
+    try:
+        rows = _db().execute("SELECT key, text, ts FROM summary_cache WHERE ts >= ? ORDER BY ts DESC LIMIT ?",
+                             (time.time() - SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX)).fetchall()
+        with _summary_cache_lock:
+            for key, text, ts in reversed(rows):
+                _summary_cache[key] = {"text": text, "ts": ts}
+        log.info("Summary cache loaded: %d entries", len(rows))
+    except Exception as e:
+        log.warning("Summary cache load failed: %s", e)
+
+
+def summary_cache_get(key):
+    with _summary_cache_lock:
+        hit = _summary_cache.get(key)
+        if hit and time.time() - hit["ts"] > SUMMARY_CACHE_TTL:
+            del _summary_cache[key]
+            summary_cache_stats["expired"] += 1
+            hit = None
+        if hit is None:
+            summary_cache_stats["misses"] += 1
+            return None
+        _summary_cache.move_to_end(key)
+        summary_cache_stats["hits"] += 1
+        return hit["text"]
+
+
+def summary_cache_put(key, text):
+    now = time.time()
+    with _summary_cache_lock:
+        _summary_cache[key] = {"text": text, "ts": now}
+        _summary_cache.move_to_end(key)
+        while len(_summary_cache) > SUMMARY_CACHE_MAX:
+            _summary_cache.popitem(last=False)
+    state_write("INSERT OR REPLACE INTO summary_cache (key, text, ts) VALUES (?, ?, ?)", [(key, text, now)])
+
+
 # Groq summarizer
 # Groq only ever receives deduplicated RSS headline text.
 # All structured data is assembled in Python and appended AFTER this returns.
 
-def summarize(raw_data, mode="all"):
+def groq_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from groq import Groq
+            # GROQ_BASE_URL points the client at a local OpenAI-compatible stand-in
+            _client = Groq(api_key=os.getenv("GROQ_API_KEY"), base_url=os.getenv("GROQ_BASE_URL") or None)
+        return _client
+
+
+def summarize(raw_data, mode, max_tokens=None, on_delta=None):
+    # on_delta(text_so_far) is called as the completion streams in
+    if mode not in SECTION_INPUT_TOKENS:
+        raise ValueError("unknown summary mode: %r" % mode)
+    # Input arrives ranked best-first; keep whole lines up to the mode's token budget
+    headlines = pack_lines(raw_data, SECTION_INPUT_TOKENS[mode])
     if mode == "geo":
         prompt = (
             "You are an intelligence analyst. Summarize the following geopolitical and conflict "
@@ -576,9 +2478,9 @@ def summarize(raw_data, mode="all"):
             "- Format links as [link](url) -- never show raw URLs\n"
             "- No market data, no tech news, no newsletter content\n"
             "- Group by region where possible (Europe, Middle East, Asia, Americas)\n\n"
-            "Raw headlines:\n" + raw_data[:6000]
+            "Raw headlines:\n" + headlines
         )
-        max_tokens = 1000
+        default_tokens = 1000
 
     elif mode == "market":
         prompt = (
@@ -590,11 +2492,11 @@ def summarize(raw_data, mode="all"):
             "- Format links as [link](url) -- never show raw URLs\n"
             "- Focus strictly on: rates, central banks, equities, crypto, commodities, economic data\n"
             "- No geopolitics unless directly market-moving, no tech product news, no newsletter content\n\n"
-            "Raw headlines:\n" + raw_data[:6000]
+            "Raw headlines:\n" + headlines
         )
-        max_tokens = 1000
+        default_tokens = 1000
 
-    elif mode == "tech":
+    else:  # tech
         prompt = (
             "You are an AI and tech analyst. Summarize the following AI and tech news headlines "
             "into concise bullets.\n\n"
@@ -603,44 +2505,47 @@ def summarize(raw_data, mode="all"):
             "- 1-2 sentences max per bullet\n"
             "- Format links as [link](url) -- never show raw URLs\n"
             "- Focus strictly on: AI models, research, startups, big tech, developer tools, crypto tech\n"
-            "- PRIORITY: Any article from a16zcrypto.com must be included -- it is a high-signal source\n"
             "- No market data, no geopolitics, no newsletter content\n\n"
-            "Raw headlines:\n" + raw_data[:6000]
+            "Raw headlines:\n" + headlines
         )
-        max_tokens = 1000
+        default_tokens = 1000
 
-    else:
-        prompt = (
-            "You are a sharp intelligence and market analyst. Summarize the headlines below "
-            "into three clearly separated sections.\n\n"
-            "Rules:\n"
-            "- Only use the RSS headlines provided -- do NOT reference newsletter content\n"
-            "- One distinct topic per bullet, 1-2 sentences max\n"
-            "- Format ALL links as [link](url) -- never show raw URLs in your output\n"
-            "- Strictly separate the three sections -- do not mix topics across them\n"
-            "- Group geopolitics by region where possible (Europe, Middle East, Asia, Americas)\n"
-            "- Do NOT add sections for newsletters, indicators, commodities, liquidations, or sentiment\n\n"
-            "Output EXACTLY this structure and nothing else:\n\n"
-            "Geopolitics & Conflicts\n"
-            "- bullet [link](url)\n\n"
-            "Markets & Macro\n"
-            "- bullet [link](url)\n\n"
-            "AI & Tech\n"
-            "- bullet [link](url)\n\n"
-            "Raw headlines:\n" + raw_data[:9000]
-        )
-        max_tokens = 2000
+    max_tokens = max_tokens or default_tokens
+    key = _summary_key(raw_data, mode)
+    cached = summary_cache_get(key)
+    if cached is not None:
+        log.info("Summary cache hit (%s): %s", mode, summary_cache_stats)
+        return cached
 
     for attempt in range(3):
+        t0 = time.monotonic()
         try:
-            chat = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
+            chat = groq_client().chat.completions.create(
+                model=GROQ_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,
                 max_tokens=max_tokens,
+                stream=on_delta is not None,
             )
-            return chat.choices[0].message.content.strip()
+            if on_delta is None:
+                text = chat.choices[0].message.content.strip()
+                usage = chat.usage
+            else:
+                pieces, usage = [], None
+                for chunk in chat:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        pieces.append(chunk.choices[0].delta.content)
+                        on_delta("".join(pieces))
+                    # Groq reports usage on the last chunk under x_groq
+                    usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                text = "".join(pieces).strip()
+            observe("groq_seconds", time.monotonic() - t0, mode=mode)
+            inc("groq_tokens_total", usage.prompt_tokens if usage else estimate_tokens(prompt), mode=mode, kind="prompt")
+            inc("groq_tokens_total", usage.completion_tokens if usage else estimate_tokens(text), mode=mode, kind="completion")
+            summary_cache_put(key, text)
+            return text
         except Exception as e:
+            inc("groq_errors_total", mode=mode)
             log.warning("Groq attempt %d failed: %s", attempt + 1, e)
             time.sleep(3 * (attempt + 1))
 
@@ -648,57 +2553,427 @@ def summarize(raw_data, mode="all"):
     return raw_data[:3500]
 
 
+# Sections of the full brief are summarized concurrently with their own
+# prompts; the output budget is split by headline volume with a floor each.
+BRIEF_SECTIONS = [
+    ("geo",    "\U0001f30d *Geopolitics & Conflicts*"),
+    ("market", "\U0001f4c8 *Markets & Macro*"),
+    ("tech",   "\U0001f916 *AI & Tech*"),
+]
+ALL_MAX_TOKENS     = 2000
+SECTION_MIN_TOKENS = 300
+
+_groq_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix="groq")
+
+
+def summarize_sections(raw_by_mode, chat_id=None):
+    """Summarize { mode: headlines } concurrently, returning { mode: summary }.
+    With chat_id, each section streams into its own live message there."""
+    counts = {mode: max(1, sum(1 for line in raw.splitlines() if line.startswith("- ")))
+              for mode, raw in raw_by_mode.items()}
+    total = sum(counts.values())
+    titles = dict(BRIEF_SECTIONS)
+    futures = {
+        mode: _groq_pool.submit(
+            _summarize_live if chat_id is not None else summarize, raw, mode,
+            max(SECTION_MIN_TOKENS, ALL_MAX_TOKENS * counts[mode] // total),
+            *((chat_id, titles[mode]) if chat_id is not None else ()))
+        for mode, raw in raw_by_mode.items()
+    }
+    return {mode: fut.result() for mode, fut in futures.items()}
+
+
+def _summarize_live(raw_data, mode, max_tokens, chat_id, header):
+    live = LiveMessage(chat_id, header)
+    summary = summarize(raw_data, mode, max_tokens, on_delta=live.update)
+    live.finish(summary)
+    return summary
+
+
 # Brief builder
+# Every build_* function returns a snapshot dict {"text": ..., "sent": [fp, ...]};
+# the snapshot layer below keeps the latest one per name so commands can
+# answer from memory instead of fetching feeds, tickers and Groq on demand.
+# Given a chat_id they also deliver progressively: structured blocks are sent
+# the moment they are ready and Groq output streams into live messages.
+
+# (name, fetcher, heading, fallback) -- structured data, never touches Groq
+BRIEF_BLOCKS = [
+    ("indicators",  get_market_update,        "\U0001f4ca *Key Indicators*\n",          "- N/A"),
+    ("commodities", get_commodities_vol,      "\U0001f6e2 *Commodities & Vol*\n",        "- N/A"),
+    ("hyper",       get_hyperliquid_snapshot, "\U0001f4a5 *Hyperliquid Liquidations*\n", "N/A"),
+    ("econ",        get_economic_calendar,    "\U0001f4c5 *Economic Calendar*\n",        "- Quiet day"),
+    ("fg",          get_fear_greed,           "\U0001f628 *Sentiment:* ",                 "N/A"),
+    ("newsletters", get_newsletters_raw,      "\U0001f4f0 *New Newsletters*\n",          "- No new newsletters since last brief."),
+]
+NEWS_FALLBACK = {"geo": "- No major updates", "market": "- No market news", "tech": "- No tech news"}
+
+
+def _result(fut, default):
+    try:
+        return fut.result() or default
+    except Exception as e:
+        log.error("Brief step failed: %s", e)
+        return default
+
+
+def _timed_call(fn, *args, stage):
+    with timed("stage_seconds", stage=stage):
+        return fn(*args)
 
-def build_and_send_brief(chat_id):
-    log.info("Building morning brief for %s", chat_id)
 
-    # Step 1: fetch and deduplicate RSS headlines for Groq
-    osint     = get_osint_news()
-    mkt_news  = get_market_news()
-    tech_news = get_tech_news()
+def _start_blocks(names, chat_id=None):
+    """Submit the named BRIEF_BLOCKS; with a private chat_id each is sent as
+    soon as it completes. Groups get them together from _send_blocks(), since
+    at 20 messages a minute one message per block would hold up the brief."""
+    futures = {}
+    for name, fn, heading, default in BRIEF_BLOCKS:
+        if name not in names:
+            continue
+        fut = futures[name] = _brief_pool.submit(_timed_call, fn, stage=name)
+        if chat_id is not None and _is_private(chat_id):
+            fut.add_done_callback(lambda f, h=heading, d=default: tg_send(chat_id, h + _result(f, d)))
+    return futures
 
-    news_raw = (
-        "GEOPOLITICS HEADLINES:\n" + osint
-        + "\n\nMARKET/MACRO HEADLINES:\n" + mkt_news
-        + "\n\nAI/TECH HEADLINES:\n" + tech_news
+
+def _send_blocks(chat_id, futures):
+    # The group-chat half of _start_blocks: all blocks in one message
+    if chat_id is not None and not _is_private(chat_id) and futures:
+        tg_send(chat_id, _render_blocks(futures))
+
+
+def _render_blocks(futures):
+    return "\n\n".join(
+        heading + _result(futures[name], default)
+        for name, _, heading, default in BRIEF_BLOCKS if name in futures
     )
 
-    # Step 2: structured data fetched in Python, never touches Groq
-    indicators  = get_market_update()
-    commodities = get_commodities_vol()
-    hyper       = get_hyperliquid_snapshot()
-    econ        = get_economic_calendar()
-    fg          = get_fear_greed()
-    newsletters = get_newsletters_raw()
 
-    # Step 3: Groq summarizes only the three news sections
-    news_summary = summarize(news_raw, mode="all")
+def render_brief(snap, parts=BRIEF_PARTS):
+    """Render a full-brief snapshot restricted to the given BRIEF_PARTS."""
+    out = [snap["title"]]
+    for mode, title in BRIEF_SECTIONS:
+        if mode in parts:
+            out.append(title + "\n" + snap["sections"][mode])
+    for name, _, heading, _ in BRIEF_BLOCKS:
+        if ("newsletters" if name == "newsletters" else "data") in parts:
+            out.append(heading + snap["blocks"][name])
+    return "\n\n".join(out)
+
 
-    # Step 4: assemble -- structured blocks appended directly by bot
+def build_brief(only_new=False, chat_id=None):
+    # only_new: scheduled briefs skip headlines an earlier brief already carried
+    sent = []
     date_str = datetime.now().strftime("%B %d, %Y %H:%M UTC")
-    full_message = (
-        "*Morning Brief -- " + date_str + "*\n\n"
-        + news_summary + "\n\n"
-        + "\U0001f4ca *Key Indicators*\n" + indicators + "\n\n"
-        + "\U0001f6e2 *Commodities & Vol*\n" + commodities + "\n\n"
-        + "\U0001f4a5 *Hyperliquid Liquidations*\n" + hyper + "\n\n"
-        + "\U0001f4c5 *Economic Calendar*\n" + econ + "\n\n"
-        + "\U0001f628 *Sentiment:* " + fg + "\n\n"
-        + "\U0001f4f0 *New Newsletters*\n" + newsletters
-    )
+    if chat_id is not None:
+        tg_send(chat_id, "*Morning Brief -- " + date_str + "*")
+
+    # Step 1+2: RSS sections and structured data are fetched concurrently;
+    # feeds that miss FEED_DEADLINE are simply left out of this brief
+    news_jobs = {
+        "geo":    _brief_pool.submit(get_osint_news, only_new, sent),
+        "market": _brief_pool.submit(get_market_news, only_new, sent),
+        "tech":   _brief_pool.submit(get_tech_news, only_new, sent),
+    }
+    blocks = _start_blocks([b[0] for b in BRIEF_BLOCKS], chat_id)
+    news_raw = {mode: _result(fut, NEWS_FALLBACK[mode]) for mode, fut in news_jobs.items()}
+
+    # Step 3: Groq summarizes only the three news sections, one call each in parallel
+    with timed("stage_seconds", stage="summarize"):
+        sections = summarize_sections(news_raw, chat_id)
+
+    # Step 4: assemble -- structured blocks appended directly by bot. The parts
+    # are kept so subscriber variants can be rendered without rebuilding.
+    snap = {
+        "title": "*Morning Brief -- " + date_str + "*",
+        "sections": sections,
+        "blocks": {name: _result(blocks[name], default) for name, _, _, default in BRIEF_BLOCKS},
+        "sent": sent,
+    }
+    snap["text"] = render_brief(snap)
+    _send_blocks(chat_id, blocks)
+    return snap
+
+
+def build_geo(chat_id=None):
+    header = "\U0001f30d *Geopolitics & Conflicts -- " + datetime.now().strftime("%H:%M UTC") + "*\n"
+    news = get_osint_news()
+    summary = _summarize_live(news, "geo", None, chat_id, header) if chat_id is not None else summarize(news, mode="geo")
+    return {"text": header + "\n" + summary, "sent": []}
+
+
+def build_market(chat_id=None):
+    header = "\U0001f4c8 *Markets & Macro -- " + datetime.now().strftime("%H:%M UTC") + "*\n"
+    blocks = _start_blocks(["indicators", "commodities", "fg"], chat_id)
+    news = get_market_news()
+    summary = _summarize_live(news, "market", None, chat_id, header) if chat_id is not None else summarize(news, mode="market")
+    _send_blocks(chat_id, blocks)
+    return {"text": header + "\n" + summary + "\n\n" + _render_blocks(blocks), "sent": []}
+
+
+def build_tech(chat_id=None):
+    header = "\U0001f916 *AI & Tech -- " + datetime.now().strftime("%H:%M UTC") + "*\n"
+    news = get_tech_news()
+    summary = _summarize_live(news, "tech", None, chat_id, header) if chat_id is not None else summarize(news, mode="tech")
+    return {"text": header + "\n" + summary, "sent": []}
+
+
+# Snapshots
+# "scheduled" is the only_new brief for the channel; it is warmed
+# SNAPSHOT_WARM_LEAD minutes before each BRIEF_TIMES slot and consumed by it.
+
+SNAPSHOT_BUILDERS = {
+    "all":       build_brief,
+    "scheduled": lambda chat_id=None: build_brief(only_new=True, chat_id=chat_id),
+    "geo":       build_geo,
+    "market":    build_market,
+    "tech":      build_tech,
+}
+
+# Background refresh cadence per snapshot, in minutes
+SNAPSHOT_REFRESH = {
+    "geo":    int(os.getenv("SNAPSHOT_REFRESH_GEO", "10")),
+    "market": int(os.getenv("SNAPSHOT_REFRESH_MARKET", "10")),
+    "tech":   int(os.getenv("SNAPSHOT_REFRESH_TECH", "20")),
+    "all":    int(os.getenv("SNAPSHOT_REFRESH_ALL", "20")),
+}
+# Seconds a snapshot may be served before a command rebuilds it: its refresh
+# interval plus SNAPSHOT_SLACK for the refresh build to land, so commands
+# never rebuild between two refreshes. SNAPSHOT_MAX_AGE overrides it for all.
+SNAPSHOT_SLACK   = int(os.getenv("SNAPSHOT_SLACK", "300"))
+SNAPSHOT_MAX_AGE = {name: int(os.getenv("SNAPSHOT_MAX_AGE", minutes * 60 + SNAPSHOT_SLACK))
+                    for name, minutes in SNAPSHOT_REFRESH.items()}
+SNAPSHOT_WARM_LEAD = 5
+BRIEF_TZ = ZoneInfo("Europe/Rome")
+BRIEF_TIMES = [(6, 0), (19, 0)]   # channel brief, and the default for subscribers
+
+_snapshots = {}   # { name: {"text": str, "sent": [fp], "built": epoch} }
+_snapshot_lock = threading.Lock()
+
+
+# Single-flight: while a snapshot is being built, further requests for it
+# (same command, same data window -- both are implied by the snapshot name)
+# wait for that build and share its result instead of starting their own.
+_flights = {}   # { key: {"done": Event, "result": ..., "error": ..., "tag": ...} }
+_flights_lock = threading.Lock()
+
+
+def singleflight(key, fn, tag=None):
+    """Run fn() once per key at a time. Returns (result, leader_tag): the
+    caller whose fn actually ran gets its own tag back."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = {"done": threading.Event(), "result": None, "error": None, "tag": tag}
+    inc("singleflight_builds_total" if leader else "singleflight_coalesced_total", key=key)
+    if not leader:
+        log.info("Coalesced request for %s", key)
+        flight["done"].wait()
+        if flight["error"] is not None:
+            raise flight["error"]
+        return flight["result"], flight["tag"]
+    try:
+        flight["result"] = fn()
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight["done"].set()
+    return flight["result"], tag
+
+
+def _build_snapshot(name, chat_id=None):
+    t0 = time.time()
+    with timed("snapshot_build_seconds", snapshot=name):
+        snap = SNAPSHOT_BUILDERS[name](chat_id=chat_id)
+    snap["built"] = time.time()
+    with _snapshot_lock:
+        _snapshots[name] = snap
+    state_write("INSERT OR REPLACE INTO snapshots (name, data, ts) VALUES (?, ?, ?)",
+                [(name, json.dumps(snap), snap["built"])])
+    log.info("Snapshot %s built in %.1fs", name, snap["built"] - t0)
+    return snap
+
+
+def _load_snapshots():
+    try:
+        rows = _db().execute("SELECT name, data FROM snapshots").fetchall()
+    except Exception as e:
+        log.warning("Snapshot load failed: %s", e)
+        return
+    loaded = []
+    with _snapshot_lock:
+        for name, data in rows:
+            if name in SNAPSHOT_BUILDERS:
+                _snapshots.setdefault(name, json.loads(data))
+                loaded.append(name)
+    log.info("Snapshots loaded: %s", ", ".join(sorted(loaded)) or "none")
+
+
+def refresh_snapshot(name, chat_id=None):
+    # chat_id: deliver the build progressively to that chat while it happens
+    snap, _ = singleflight(name, lambda: _build_snapshot(name, chat_id), tag=chat_id)
+    return snap
+
+
+def fresh_snapshot(name, max_age=None):
+    """Return the cached snapshot if it is younger than max_age seconds, else None."""
+    max_age = SNAPSHOT_MAX_AGE.get(name, SNAPSHOT_SLACK) if max_age is None else max_age
+    with _snapshot_lock:
+        snap = _snapshots.get(name)
+    if snap and time.time() - snap["built"] <= max_age:
+        return snap
+    return None
 
-    tg_send(chat_id, full_message)
-    save_last_brief_time()
+
+def get_snapshot(name, max_age=None):
+    return fresh_snapshot(name, max_age) or refresh_snapshot(name)
+
+
+def serve_snapshot(chat_id, name, placeholder):
+    snap = fresh_snapshot(name)
+    if snap is not None:
+        tg_send(chat_id, snap["text"])
+        return
+    # Nothing fresh: build now, streaming the pieces to the chat as they land.
+    # If a build is already running we get its result once it finishes -- unless
+    # it is streaming into this very chat already.
+    tg_send(chat_id, placeholder)
+    snap, leader_chat = singleflight(name, lambda: _build_snapshot(name, chat_id), tag=chat_id)
+    if leader_chat != chat_id:
+        tg_send(chat_id, snap["text"])
 
 
 def send_scheduled_brief():
-    build_and_send_brief(CHANNEL_ID)
+    # Use the brief warmed a few minutes ago if there is one, then retire it
+    snap = get_snapshot("scheduled", max_age=(SNAPSHOT_WARM_LEAD + 5) * 60)
+    with _snapshot_lock:
+        _snapshots.pop("scheduled", None)
+    state_write("DELETE FROM snapshots WHERE name = ?", [("scheduled",)])
+    tg_send(CHANNEL_ID, snap["text"])
+    mark_sent(snap["sent"])
+    save_last_brief_time()
+
+
+# Deliveries run here, one at a time and in order, so the every-minute job
+# only looks up who is due and never waits on a build: a slow build would
+# otherwise make the scheduler skip the next minute's run and its subscribers.
+_delivery_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deliver")
+
+
+def deliver_due_briefs():
+    """Runs every minute: queue the brief for subscribers due now, and warm it
+    ahead of upcoming slots."""
+    now = datetime.now(BRIEF_TZ)
+    soon = (now + timedelta(minutes=SNAPSHOT_WARM_LEAD)).strftime("%H:%M")
+    if due_subscribers(soon) and not fresh_snapshot("all", SNAPSHOT_WARM_LEAD * 60):
+        threading.Thread(target=refresh_snapshot, args=("all",), daemon=True).start()
+
+    due = due_subscribers(now.strftime("%H:%M"))
+    if due:
+        _delivery_pool.submit(_deliver_brief, due)
+
+
+def _deliver_brief(due):
+    # Rendered once per distinct parts selection
+    try:
+        snap = get_snapshot("all")
+    except Exception as e:
+        log.error("Scheduled brief for %d subscribers failed: %s", len(due), e)
+        return
+    variants = {}
+    for chat_id, parts in due:
+        variants.setdefault(parts, []).append(chat_id)
+    for parts, chat_ids in variants.items():
+        tg_broadcast(chat_ids, render_brief(snap, parts))
+    log.info("Scheduled brief queued for %d subscribers in %d variants", len(due), len(variants))
+
+
+# Command execution
+# Handlers only enqueue: commands run on one of two lanes -- "fast" for cheap
+# ones (/help, /liqs, /subscribe) and "heavy" for brief builds -- so a slow
+# build never holds up polling or the cheap commands. Each chat may have at
+# most CMD_CHAT_QUEUE commands queued or running on each lane, so a chat with
+# builds piled up still gets its cheap commands; repeating a command that is
+# still waiting in the queue replaces the earlier request.
+CMD_FAST_WORKERS = int(os.getenv("CMD_FAST_WORKERS", "4"))
+CMD_HEAVY_WORKERS = int(os.getenv("CMD_HEAVY_WORKERS", "4"))
+CMD_CHAT_QUEUE = int(os.getenv("CMD_CHAT_QUEUE", "3"))
+
+_lanes = {
+    "fast": ThreadPoolExecutor(max_workers=CMD_FAST_WORKERS, thread_name_prefix="cmd-fast"),
+    "heavy": ThreadPoolExecutor(max_workers=CMD_HEAVY_WORKERS, thread_name_prefix="cmd-heavy"),
+}
+_chat_jobs = {}   # { (chat_id, lane): [(command name, Future), ...] } queued or running
+_chat_jobs_lock = threading.Lock()
+
+
+_first_command = threading.Event()
+
+
+def _run_command(fn, message):
+    if not _first_command.is_set():
+        _first_command.set()
+        log.info("First command (/%s) picked up %.2fs after start", fn.__name__[4:], time.monotonic() - _STARTED)
+        observe("startup_seconds", time.monotonic() - _STARTED, until="first_command")
+    try:
+        with timed("command_seconds", command=fn.__name__[4:]):
+            fn(message)
+    except Exception as e:
+        inc("command_errors_total", command=fn.__name__[4:])
+        log.exception("Command %s failed for chat %s: %s", fn.__name__, message.chat.id, e)
+
+
+def _job_done(key, future):
+    if future.cancelled():
+        return   # superseded -- submit_command already dropped it
+    with _chat_jobs_lock:
+        jobs = [j for j in _chat_jobs.get(key, []) if j[1] is not future]
+        if jobs:
+            _chat_jobs[key] = jobs
+        else:
+            _chat_jobs.pop(key, None)
+
+
+def submit_command(lane, fn, message):
+    chat_id = message.chat.id
+    key = (chat_id, lane)
+    with _chat_jobs_lock:
+        jobs = _chat_jobs.setdefault(key, [])
+        for name, future in list(jobs):
+            if name == fn.__name__ and future.cancel():
+                jobs.remove((name, future))
+                log.info("Superseded queued %s for chat %s", name, chat_id)
+        if len(jobs) >= CMD_CHAT_QUEUE:
+            busy = True
+        else:
+            busy = False
+            future = _lanes[lane].submit(_run_command, fn, message)
+            jobs.append((fn.__name__, future))
+    if busy:
+        log.info("Chat %s has %d %s commands pending, dropping %s", chat_id, CMD_CHAT_QUEUE, lane, fn.__name__)
+        tg_send(chat_id, "Still working on your earlier requests -- try again in a moment.", parse_mode=None)
+        return
+    future.add_done_callback(lambda f: _job_done(key, f))
+
+
+COMMANDS = []   # (lane, commands, fn) -- registered with the bot by create_bot()
+
+
+def command(lane, *commands):
+    """Add fn to COMMANDS for `commands`, to run on `lane` off the polling thread."""
+    def register(fn):
+        COMMANDS.append((lane, list(commands), fn))
+        return fn
+    return register
 
 
 # Commands
 
-@bot.message_handler(commands=["help"])
+@command("fast", "help")
 def cmd_help(message):
     text = (
         "\U0001f4cb *Commands*\n\n"
@@ -706,82 +2981,163 @@ def cmd_help(message):
         "/geo -- geopolitics & conflicts\n"
         "/market -- markets, macro, tickers & sentiment\n"
         "/tech -- AI & tech news\n"
-        "/liqs -- Hyperliquid liquidation snapshot\n"
+        "/liqs [hours] -- Hyperliquid liquidation snapshot\n"
+        "/subscribe [parts] [HH:MM ...] -- get the brief here on a schedule\n"
+        "/unsubscribe -- stop scheduled briefs\n"
         "/help -- show this menu\n"
     )
     tg_send(message.chat.id, text)
 
 
-@bot.message_handler(commands=["all", "brief", "full"])
+@command("heavy", "all", "brief", "full")
 def cmd_all(message):
     log.info("Received /all from chat_id=%s", message.chat.id)
-    tg_send(message.chat.id, "Building your morning brief...")
-    build_and_send_brief(message.chat.id)
+    serve_snapshot(message.chat.id, "all", "Building your morning brief...")
 
 
-@bot.message_handler(commands=["geo", "geopolitics"])
+@command("heavy", "geo", "geopolitics")
 def cmd_geo(message):
     log.info("Received /geo from chat_id=%s", message.chat.id)
-    tg_send(message.chat.id, "Fetching geopolitics...")
-    data = get_osint_news()
-    summary = summarize(data, mode="geo")
-    tg_send(
-        message.chat.id,
-        "\U0001f30d *Geopolitics & Conflicts -- " + datetime.now().strftime("%H:%M UTC") + "*\n\n" + summary
-    )
+    serve_snapshot(message.chat.id, "geo", "Fetching geopolitics...")
 
 
-@bot.message_handler(commands=["market"])
+@command("heavy", "market")
 def cmd_market(message):
     log.info("Received /market from chat_id=%s", message.chat.id)
-    tg_send(message.chat.id, "Fetching markets...")
-    news        = get_market_news()
-    summary     = summarize(news, mode="market")
-    indicators  = get_market_update()
-    commodities = get_commodities_vol()
-    fg          = get_fear_greed()
-    full = (
-        "\U0001f4c8 *Markets & Macro -- " + datetime.now().strftime("%H:%M UTC") + "*\n\n"
-        + summary + "\n\n"
-        + "\U0001f4ca *Key Indicators*\n" + indicators + "\n\n"
-        + "\U0001f6e2 *Commodities & Vol*\n" + commodities + "\n\n"
-        + "\U0001f628 *Sentiment:* " + fg
-    )
-    tg_send(message.chat.id, full)
+    serve_snapshot(message.chat.id, "market", "Fetching markets...")
 
 
-@bot.message_handler(commands=["tech"])
+@command("heavy", "tech")
 def cmd_tech(message):
     log.info("Received /tech from chat_id=%s", message.chat.id)
-    tg_send(message.chat.id, "Fetching AI & tech...")
-    data    = get_tech_news()
-    summary = summarize(data, mode="tech")
-    tg_send(
-        message.chat.id,
-        "\U0001f916 *AI & Tech -- " + datetime.now().strftime("%H:%M UTC") + "*\n\n" + summary
-    )
+    serve_snapshot(message.chat.id, "tech", "Fetching AI & tech...")
 
 
-@bot.message_handler(commands=["liqs"])
+@command("fast", "liqs")
 def cmd_liqs(message):
     log.info("Received /liqs from chat_id=%s", message.chat.id)
-    snapshot = get_hyperliquid_snapshot()
+    # Optional window in hours: /liqs 4
+    args = (message.text or "").split()[1:]
+    hours = int(args[0]) if args and args[0].isdigit() and 0 < int(args[0]) <= LIQ_MAX_HOURS else 12
+    snapshot = get_hyperliquid_snapshot(hours)
     tg_send(
         message.chat.id,
         "\U0001f4a5 *Hyperliquid Snapshot -- " + datetime.now().strftime("%H:%M UTC") + "*\n\n" + snapshot
     )
 
 
-# Scheduler
-
-scheduler = BackgroundScheduler(timezone="Europe/Rome")
-scheduler.add_job(send_scheduled_brief, "cron", hour=6, minute=0)
-scheduler.add_job(send_scheduled_brief, "cron", hour=19, minute=0)
-scheduler.add_job(_check_push_accounts, "interval", minutes=10)
-scheduler.start()
-
-# Seed push-seen IDs on startup (so we don't flood on first boot)
-_check_push_accounts()
-
-log.info("Coffee Brief bot STARTED")
-bot.infinity_polling()
+@command("fast", "subscribe")
+def cmd_subscribe(message):
+    log.info("Received /subscribe from chat_id=%s", message.chat.id)
+    current = get_subscription(message.chat.id)
+    parts, times = [], []
+    for arg in (message.text or "").lower().split()[1:]:
+        m = re.fullmatch(r"(\d{1,2}):(\d{2})", arg)
+        if arg in BRIEF_PARTS:
+            parts.append(arg)
+        elif m and int(m.group(1)) < 24 and int(m.group(2)) < 60:
+            times.append("{:02d}:{}".format(int(m.group(1)), m.group(2)))
+        else:
+            tg_send(message.chat.id,
+                    "Usage: /subscribe [" + " ".join(BRIEF_PARTS) + "] [HH:MM ...]\n"
+                    "e.g. /subscribe geo tech 07:30 -- times are Europe/Rome", parse_mode=None)
+            return
+    # Anything not given keeps its current value, or the default for new subscribers
+    parts = [p for p in BRIEF_PARTS if p in parts] or (current[0] if current else list(BRIEF_PARTS))
+    times = times or (current[1] if current else ["{:02d}:{:02d}".format(h, m) for h, m in BRIEF_TIMES])
+    subscribe(message.chat.id, parts, times)
+    tg_send(message.chat.id, "\u2705 Subscribed: " + ", ".join(parts) + " at " + ", ".join(sorted(times)) + " (Europe/Rome)",
+            parse_mode=None)
+
+
+@command("fast", "unsubscribe")
+def cmd_unsubscribe(message):
+    log.info("Received /unsubscribe from chat_id=%s", message.chat.id)
+    if unsubscribe(message.chat.id):
+        tg_send(message.chat.id, "Unsubscribed from scheduled briefs.")
+    else:
+        tg_send(message.chat.id, "This chat isn't subscribed.")
+
+
+@command("fast", "stats")
+def cmd_stats(message):
+    if message.from_user is None or message.from_user.id not in ADMIN_IDS:
+        return
+    log.info("Received /stats from chat_id=%s", message.chat.id)
+    now = time.time()
+    tripped = [url for url, h in feed_health().items() if h["open_until"] > now and h["streak"] >= FEED_BREAKER_FAILURES]
+    text = (stats_summary() + "\n\nsummary cache " + json.dumps(summary_cache_stats)
+            + "\nfeeds skipped (breaker open): " + (", ".join(tripped) or "none"))
+    tg_send(message.chat.id, text, parse_mode=None)
+
+
+# Startup
+
+def create_bot(token=None):
+    """Create the bot and register every handler in COMMANDS."""
+    global bot
+    # TELEGRAM_API_URL points the bot at a local Bot API stand-in
+    if os.getenv("TELEGRAM_API_URL"):
+        telebot.apihelper.API_URL = os.getenv("TELEGRAM_API_URL").rstrip("/") + "/bot{0}/{1}"
+    bot = telebot.TeleBot(token or os.getenv("TELEGRAM_TOKEN"))
+    for lane, commands, fn in COMMANDS:
+        bot.register_message_handler(lambda message, lane=lane, fn=fn: submit_command(lane, fn, message),
+                                     commands=commands)
+    return bot
+
+
+def create_scheduler():
+    from apscheduler.schedulers.background import BackgroundScheduler
+    scheduler = BackgroundScheduler(timezone=BRIEF_TZ)
+    for hour, minute in BRIEF_TIMES:
+        scheduler.add_job(send_scheduled_brief, "cron", hour=hour, minute=minute)
+        warm = datetime(2000, 1, 1, hour, minute) - timedelta(minutes=SNAPSHOT_WARM_LEAD)
+        scheduler.add_job(refresh_snapshot, "cron", hour=warm.hour, minute=warm.minute, args=["scheduled"])
+    for name, minutes in SNAPSHOT_REFRESH.items():
+        scheduler.add_job(refresh_snapshot, "interval", minutes=minutes, args=[name])
+    scheduler.add_job(deliver_due_briefs, "cron", minute="*")
+    scheduler.add_job(_check_push_accounts, "interval", seconds=PUSH_TICK)
+    scheduler.add_job(prune_state, "interval", minutes=STATE_PRUNE_MINUTES)
+    scheduler.add_job(sync_acled, "interval", minutes=ACLED_SYNC_MINUTES)
+    return scheduler
+
+
+def _warm_up(scheduler):
+    # Runs after polling has started: state first, so snapshots from the last
+    # process are served right away and rebuilds get 304s and summary hits;
+    # only snapshots past their refresh interval are rebuilt now
+    _import_legacy_files()
+    _load_feed_cache()
+    _load_summary_cache()
+    _load_snapshots()
+    scheduler.add_job(sync_acled)
+    for name, minutes in SNAPSHOT_REFRESH.items():
+        if not fresh_snapshot(name, minutes * 60):
+            scheduler.add_job(refresh_snapshot, args=[name])
+    _check_push_accounts()
+    prune_state()
+    log.info("Warm-up queued %.2fs after start", time.monotonic() - _STARTED)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    # On SIGTERM (a redeploy) exit normally: builds still running finish, then
+    # the atexit flush writes whatever they queued
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    atexit.register(state_flush)
+    create_bot()
+    _start_state_writer()
+    _start_send_workers()
+    threading.Thread(target=_hyperliquid_ingester, daemon=True).start()
+    log.info("Hyperliquid liquidation stream started")
+    scheduler = create_scheduler()
+    scheduler.start()
+    if METRICS_PORT:
+        start_metrics_server()
+    threading.Thread(target=_warm_up, args=(scheduler,), daemon=True).start()
+    log.info("Coffee Brief bot STARTED in %.2fs", time.monotonic() - _STARTED)
+    bot.infinity_polling()
+
+
+if __name__ == "__main__":
+    main()